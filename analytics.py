@@ -0,0 +1,132 @@
+"""Headless, vectorised trading metrics behind the dashboard pages.
+
+Functions here take the aggregates and frames returned by db_manager (amounts in integer
+cents, dates as YYYYMMDD integers) and return plain numbers or new frames. They never mutate
+their input, which may be a shared cached result, and never loop over rows in Python. The
+`user_*` wrappers build the same results from db_manager's aggregates and P&L series without
+loading the trade list, memoised on the user's data version through the read cache; the
+dashboard instead derives the series from its session-held, incrementally synced frame.
+"""
+import numpy as np
+import pandas as pd
+
+import db_manager as db
+
+ROLLING_WINDOW = 20   # trades per rolling ROI window
+
+def _roi(pnl, spent):
+    return (pnl / spent * 100) if spent > 0 else 0.0
+
+def streaks(pnl):
+    """Longest winning / losing runs and the current run (+n wins, -n losses) over an ordered pnl series.
+
+    Flat (zero P&L) trades end a run without starting one.
+    """
+    sign = np.sign(pnl.to_numpy())
+    if len(sign) == 0:
+        return {'longest_win_streak': 0, 'longest_loss_streak': 0, 'current_streak': 0}
+    # Start a new run wherever the sign changes, then measure every run at once
+    starts = np.flatnonzero(np.r_[True, sign[1:] != sign[:-1]])
+    lengths = np.diff(np.r_[starts, len(sign)])
+    run_sign = sign[starts]
+    win_runs, loss_runs = lengths[run_sign > 0], lengths[run_sign < 0]
+    return {
+        'longest_win_streak': int(win_runs.max()) if len(win_runs) else 0,
+        'longest_loss_streak': int(loss_runs.max()) if len(loss_runs) else 0,
+        'current_streak': int(lengths[-1] * run_sign[-1]),
+    }
+
+def drawdown(pnl):
+    """Maximum peak-to-trough fall of cumulative P&L, in dollars and as % of the peak."""
+    equity = pnl.cumsum().to_numpy() / 100
+    if len(equity) == 0:
+        return {'max_drawdown': 0.0, 'max_drawdown_pct': 0.0}
+    # The account starts flat, so a run of early losses counts as a drawdown from zero
+    peak = np.maximum.accumulate(np.maximum(equity, 0))
+    falls = equity - peak
+    trough = int(falls.argmin())
+    fall = float(-falls[trough]) + 0.0   # + 0.0 turns the -0.0 of a never-falling curve into 0.0
+    return {
+        'max_drawdown': fall,
+        'max_drawdown_pct': float(fall / peak[trough] * 100) if peak[trough] > 0 else 0.0,
+    }
+
+def summary_metrics(totals):
+    """Totals, ROI, average size, win rate and profit factor from TRADE_AGGREGATES-style cent totals."""
+    spent = totals['spent_cents'] / 100
+    pnl = totals['pnl_cents'] / 100
+    count = totals['trades']
+    gross_profit = totals['gross_profit_cents'] / 100
+    gross_loss = totals['gross_loss_cents'] / 100
+    return {
+        'spent': spent,
+        'earned': totals['earned_cents'] / 100,
+        'pnl': pnl,
+        'roi': _roi(pnl, spent),
+        'count': count,
+        'avg_trade': spent / count if count else 0.0,
+        'win_rate': totals['wins'] / count * 100 if count else 0.0,
+        'profit_factor': gross_profit / gross_loss if gross_loss else (float('inf') if gross_profit else 0.0),
+    }
+
+def market_report(markets):
+    """Per-market cent totals (event, trades, wins, ...) with dollars, ROI and win rate, most profitable first."""
+    out = markets.assign(
+        spent=markets['spent_cents'] / 100,
+        earned=markets['earned_cents'] / 100,
+        pnl=markets['pnl_cents'] / 100,
+        roi=(markets['pnl_cents'] / markets['spent_cents'].where(markets['spent_cents'] > 0) * 100).fillna(0.0),
+        win_rate=markets['wins'] / markets['trades'] * 100,
+    )
+    return out[['event', 'trades', 'spent', 'earned', 'pnl', 'roi', 'win_rate']].sort_values('pnl', ascending=False)
+
+def pnl_series(trades, event=None):
+    """A newest-first trades frame (sync_user_trades layout) as a get_pnl_series frame, optionally one market."""
+    if event is not None:
+        trades = trades[trades['event'] == event]
+    # Reversing the date DESC, id DESC order gives trade order without a sort
+    return trades.iloc[::-1][['date', 'spent_cents', 'pnl_cents']].reset_index(drop=True)
+
+def ledger_metrics(totals, series):
+    """summary_metrics plus drawdown and streaks, from cent totals and the matching P&L series."""
+    metrics = summary_metrics(totals)
+    metrics.update(drawdown(series['pnl_cents']))
+    metrics.update(streaks(series['pnl_cents']))
+    return metrics
+
+def rolling_roi(series, window=ROLLING_WINDOW):
+    """ROI (%) over each trailing `window` trades of a get_pnl_series frame."""
+    spent = series['spent_cents'].rolling(window, min_periods=1).sum()
+    pnl = series['pnl_cents'].rolling(window, min_periods=1).sum()
+    return pd.DataFrame({
+        'trade_no': np.arange(1, len(series) + 1),
+        'date': series['date'].to_numpy(),
+        'rolling_roi': (pnl / spent.where(spent > 0) * 100).fillna(0.0).to_numpy(),
+    })
+
+def monthly_report(monthly):
+    """Monthly rollup rows with dollar amounts, a 'Mon YYYY' label and cumulative P&L."""
+    return monthly.assign(
+        month_label=pd.to_datetime(monthly['month'].astype(str), format='%Y%m').dt.strftime('%b %Y'),
+        spent=monthly['spent_cents'] / 100,
+        earned=monthly['earned_cents'] / 100,
+        pnl=monthly['pnl_cents'] / 100,
+        cumulative_pnl=monthly['pnl_cents'].cumsum() / 100
+    )
+
+@db.cached_read
+def user_metrics(user_id, event=None, start=None, end=None):
+    """Headline numbers for a user's ledger (or one market / date range), memoised until their data changes.
+
+    Totals come from SQL aggregates; drawdown and streaks from the P&L series alone.
+    """
+    return ledger_metrics(db.get_trade_totals(user_id, event, start, end), db.get_pnl_series(user_id, event, start, end))
+
+@db.cached_read
+def user_market_breakdown(user_id, start=None, end=None):
+    return market_report(db.get_trade_breakdown(user_id, 'event', start=start, end=end))
+
+@db.cached_read
+def user_rolling_roi(user_id, event=None, start=None, end=None, window=ROLLING_WINDOW):
+    # Same get_pnl_series arguments as user_metrics, so a caller reads the series once
+    return rolling_roi(db.get_pnl_series(user_id, event, start, end), window)
@@ -0,0 +1,348 @@
+"""Headless HTTP API for programmatic trade logging, next to the Streamlit app.
+
+    python api.py [--host HOST] [--port PORT]
+
+    POST /api/token          {"username", "password"} -> {"token", "user_id", "username"}
+    POST /api/trades         {"date", "event", "spent", "earned"} -> 201 {"id"}
+    POST /api/trades/bulk    {"trades": [...]} -> 201 {"ids": [...]}, all or nothing
+    GET  /api/trades         ?limit=&cursor=&q= -> {"trades": [...], "next_cursor"}
+    GET  /api/metrics        ?event=&start=&end= -> headline metrics (totals, ROI, win rate, drawdown, streaks)
+    GET  /api/markets        ?start=&end= -> per-market breakdown
+    GET  /api/monthly        ?event= -> monthly totals
+    GET  /api/health
+
+Everything but /api/token and /api/health needs `Authorization: Bearer <token>`. Tokens
+are the signed session tokens from auth, so logging in costs one bcrypt verification on
+the auth pool; verified tokens are then cached for TRADEFLOW_API_TOKEN_CACHE_S seconds, which
+is also how long a token revoked by logout keeps working here.
+
+One asyncio loop handles the connections. Reads run on a thread pool; inserts go straight
+to db_manager's write queue, so trades submitted by every client at the same moment share
+one group commit, and a bulk submission is a single queued write.
+
+    TRADEFLOW_API_HOST            bind address (default 127.0.0.1)
+    TRADEFLOW_API_PORT            port (default 8502)
+    TRADEFLOW_API_WORKERS         threads for database reads (default 8)
+    TRADEFLOW_API_TOKEN_CACHE_S   seconds a verified token is trusted without a lookup (default 60)
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import analytics
+import auth
+import db_manager as db
+
+API_HOST = os.environ.get("TRADEFLOW_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("TRADEFLOW_API_PORT", "8502"))
+API_WORKERS = int(os.environ.get("TRADEFLOW_API_WORKERS", "8"))
+API_TOKEN_CACHE_S = float(os.environ.get("TRADEFLOW_API_TOKEN_CACHE_S", "60"))
+TOKEN_CACHE_MAX_ENTRIES = 10000
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 8 * 1024 * 1024
+MAX_BULK_TRADES = 10000
+MAX_PAGE_SIZE = 500
+KEEPALIVE_TIMEOUT_S = 30
+
+_log = logging.getLogger("tradeflow.api")
+_pool = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="tradeflow-api")
+
+class ApiError(Exception):
+    """Turned into a JSON error response with `status`."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class TokenCache:
+    """Thread-safe LRU of token -> (user_id, username) entries that expire after `ttl_s`."""
+
+    def __init__(self, ttl_s=API_TOKEN_CACHE_S, max_entries=TOKEN_CACHE_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def put(self, token, user):
+        with self._lock:
+            self._entries[token] = (time.monotonic() + self.ttl_s, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+_tokens = TokenCache()
+
+def _run(fn, *args):
+    return asyncio.get_running_loop().run_in_executor(_pool, fn, *args)
+
+async def _authenticate(headers):
+    scheme, _, token = headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        raise ApiError(HTTPStatus.UNAUTHORIZED, "missing bearer token")
+    user = _tokens.get(token)
+    if user is None:
+        # Signature check plus an account lookup; repeat requests skip both until the entry expires
+        user = await _run(auth.verify_session_token, token)
+        if user[0] is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "invalid or expired token")
+        _tokens.put(token, user)
+    return user[0]
+
+def _parse_trade(item):
+    """Validated (date, event, spent, earned) from a JSON trade object, or ApiError."""
+    if not isinstance(item, dict):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "trade must be an object")
+    try:
+        day = datetime.date.fromisoformat(str(item['date'])[:10])
+    except (KeyError, ValueError):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "date must be YYYY-MM-DD")
+    event = item.get('event')
+    if not isinstance(event, str) or not event.strip():
+        raise ApiError(HTTPStatus.BAD_REQUEST, "event is required")
+    amounts = []
+    for field in ('spent', 'earned'):
+        value = item.get(field)
+        # The range check also rejects NaN and infinity, and keeps huge ints away from float conversion
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= db.MAX_AMOUNT:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"{field} must be a number from 0 to {db.MAX_AMOUNT:,}")
+        amounts.append(value)
+    # Same normalisation as the dashboard form
+    return day, event.strip().upper(), *amounts
+
+def _trade_json(row):
+    return {
+        'id': row.id, 'date': db.key_to_date(row.date).isoformat(), 'event': row.event,
+        'spent': row.spent_cents / 100, 'earned': row.earned_cents / 100, 'pnl': row.pnl_cents / 100,
+    }
+
+def _records(frame):
+    return [{col: _plain(value) for col, value in row.items()} for row in frame.to_dict('records')]
+
+def _plain(value):
+    # numpy scalars -> Python; non-finite floats (e.g. profit factor with no losses) -> null
+    value = value.item() if hasattr(value, 'item') else value
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+def _cursor(params):
+    raw = params.get('cursor')
+    if raw is None:
+        return None
+    try:
+        day, trade_id = raw.split(':')
+        return int(day), int(trade_id)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "invalid cursor")
+
+def _date_range(params):
+    # Optional inclusive start/end dates (YYYY-MM-DD)
+    bounds = []
+    for name in ('start', 'end'):
+        try:
+            bounds.append(datetime.date.fromisoformat(params[name]) if params.get(name) else None)
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be YYYY-MM-DD")
+    return bounds
+
+def _limit(params):
+    try:
+        limit = int(params.get('limit', db.HISTORY_PAGE_SIZE))
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "limit must be an integer")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+async def issue_token(body, params, headers):
+    if not isinstance(body, dict) or not all(isinstance(body.get(key), str) and body[key]
+                                             for key in ('username', 'password')):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "username and password are required strings")
+    try:
+        user_id, username = await asyncio.wrap_future(auth.login(body['username'], body['password']))
+    except auth.RateLimitError as e:
+        raise ApiError(HTTPStatus.TOO_MANY_REQUESTS, str(e))
+    if user_id is None:
+        raise ApiError(HTTPStatus.UNAUTHORIZED, "invalid username or password")
+    token = await _run(auth.issue_session_token, user_id, username)
+    _tokens.put(token, (user_id, username))
+    return HTTPStatus.OK, {'token': token, 'user_id': user_id, 'username': username,
+                           'expires_in': int(auth.SESSION_HOURS * 3600)}
+
+async def submit_trade(body, params, headers):
+    user_id = await _authenticate(headers)
+    trade_id = await asyncio.wrap_future(db.submit_trade(user_id, *_parse_trade(body)))
+    return HTTPStatus.CREATED, {'id': trade_id}
+
+async def submit_bulk(body, params, headers):
+    user_id = await _authenticate(headers)
+    items = body.get('trades') if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "trades must be a non-empty list")
+    if len(items) > MAX_BULK_TRADES:
+        raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"at most {MAX_BULK_TRADES} trades per request")
+    trades = []
+    for index, item in enumerate(items):
+        try:
+            trades.append(_parse_trade(item))
+        except ApiError as e:
+            raise ApiError(e.status, f"trades[{index}]: {e}")
+    ids = await asyncio.wrap_future(db.submit_trades(user_id, trades))
+    return HTTPStatus.CREATED, {'ids': ids}
+
+async def list_trades(body, params, headers):
+    user_id = await _authenticate(headers)
+    cursor, limit, query = _cursor(params), _limit(params), params.get('q', '').strip()
+    if query:
+        page, next_cursor = await _run(db.search_trades, user_id, query, limit, cursor)
+    else:
+        page, next_cursor = await _run(db.get_trades_page, user_id, cursor, limit)
+    return HTTPStatus.OK, {
+        'trades': [_trade_json(row) for row in page.itertuples(index=False)],
+        'next_cursor': f"{next_cursor[0]}:{next_cursor[1]}" if next_cursor else None,
+    }
+
+async def metrics(body, params, headers):
+    user_id = await _authenticate(headers)
+    result = await _run(analytics.user_metrics, user_id, params.get('event'), *_date_range(params))
+    return HTTPStatus.OK, {key: _plain(value) for key, value in result.items()}
+
+async def markets(body, params, headers):
+    user_id = await _authenticate(headers)
+    frame = await _run(analytics.user_market_breakdown, user_id, *_date_range(params))
+    return HTTPStatus.OK, {'markets': _records(frame)}
+
+async def monthly(body, params, headers):
+    user_id = await _authenticate(headers)
+    rollups = await _run(db.get_monthly_rollups, user_id, params.get('event'))
+    frame = await _run(analytics.monthly_report, rollups)
+    return HTTPStatus.OK, {'months': _records(frame[['month', 'trade_count', 'spent', 'earned', 'pnl', 'cumulative_pnl']])}
+
+async def health(body, params, headers):
+    return HTTPStatus.OK, {'status': 'ok', 'write_queues': await _run(db.write_queue_stats)}
+
+ROUTES = {
+    ('POST', '/api/token'): issue_token,
+    ('POST', '/api/trades'): submit_trade,
+    ('POST', '/api/trades/bulk'): submit_bulk,
+    ('GET', '/api/trades'): list_trades,
+    ('GET', '/api/metrics'): metrics,
+    ('GET', '/api/markets'): markets,
+    ('GET', '/api/monthly'): monthly,
+    ('GET', '/api/health'): health,
+}
+
+async def _read_request(reader):
+    """(method, path, params, headers, body) of the next request, or None at end of connection."""
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT_S)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise ApiError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "headers too large")
+    lines = head.decode('latin-1').split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "invalid Content-Length")
+    if length < 0 or length > MAX_BODY_BYTES:
+        raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "request body too large")
+    body = await reader.readexactly(length) if length else b""
+
+    url = urlsplit(target)
+    params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    return method.upper(), url.path.rstrip('/') or '/', params, headers, body
+
+async def _dispatch(method, path, params, headers, body):
+    handler = ROUTES.get((method, path))
+    if handler is None:
+        if any(route_path == path for _, route_path in ROUTES):
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed on {path}")
+        raise ApiError(HTTPStatus.NOT_FOUND, f"no route for {path}")
+    try:
+        payload = json.loads(body) if body else None
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "body must be JSON")
+    return await handler(payload, params, headers)
+
+def _response(status, payload, keep_alive):
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('ascii') + body
+
+async def handle_connection(reader, writer):
+    try:
+        while True:
+            keep_alive = False
+            try:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, params, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                status, payload = await _dispatch(method, path, params, headers, body)
+            except ApiError as e:
+                status, payload = HTTPStatus(e.status), {'error': str(e)}
+            except Exception:
+                _log.exception("unhandled API error")
+                status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "internal error"}
+            writer.write(_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def start_server(host=API_HOST, port=API_PORT):
+    """Starts listening (after bringing the schema up to date). Returns the asyncio.Server."""
+    await _run(db.init_db)
+    return await asyncio.start_server(handle_connection, host, port, limit=MAX_HEADER_BYTES)
+
+async def serve(host=API_HOST, port=API_PORT):
+    server = await start_server(host, port)
+    _log.info("TradeFlow API listening on %s", ", ".join(str(s.getsockname()) for s in server.sockets))
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TradeFlow ingestion API")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
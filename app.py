@@ -1,193 +1,35 @@
 import streamlit as st
 import db_manager as db
-import pandas as pd
-import plotly.express as px
+import auth
+import instrumentation
+import maintenance
 from datetime import date
+import importlib.util
+import io
+import json
+import os
+import re
 import time
 
+STYLESHEET = os.path.join(os.path.dirname(__file__), "static", "style.css")
+SESSION_COOKIE = "tradeflow_session"
+
+@st.cache_resource
+def stylesheet():
+    """The app stylesheet, read and minified once per process."""
+    with open(STYLESHEET) as f:
+        css = re.sub(r"/\*.*?\*/", "", f.read(), flags=re.S)
+    return re.sub(r"\s*([{};,>])\s*", r"\1", " ".join(css.split()))
+
 # Page Config
 st.set_page_config(page_title="TradeFlow Tracker", page_icon="📈", layout="centered", initial_sidebar_state="collapsed")
 
 # Initialize DB
 db.init_db()
+maintenance.start_scheduler()
 
-# Custom CSS for Mobile-First Enterprise Look
-st.markdown("""
-    <style>
-    /* Global Styles & Theme Fixes */
-    html, body, [class*="css"] {
-        font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif;
-        color: #1e293b !important;
-    }
-    
-    /* Force Solid Background to prevent transparency issues */
-    .stApp {
-        background-color: #f8fafc !important;
-    }
-
-    /* Force Header Visibility - Fix for White-on-White */
-    h1, h2, h3, h4, h5, h6, .stMarkdown p {
-        color: #0f172a !important;
-    }
-    
-    .stTitle h1 {
-        font-size: 2.2rem !important;
-        font-weight: 800 !important;
-        letter-spacing: -0.05em !important;
-        color: #0f172a !important;
-        margin-bottom: 1.5rem !important;
-        line-height: 1.2 !important;
-    }
-
-    /* Expander Labels Visibility */
-    .st-emotion-cache-p6495, .st-emotion-cache-1pxm689, p {
-        color: #334155 !important;
-    }
-
-    /* Input Field Labels */
-    label[data-testid="stWidgetLabel"] p {
-        font-weight: 600 !important;
-        color: #475569 !important;
-        font-size: 0.95rem !important;
-    }
-
-    /* Cards & Containers */
-    .trade-card {
-        background: white !important;
-        padding: 1.5rem;
-        border-radius: 20px;
-        box-shadow: 0 10px 15px -3px rgba(0, 0, 0, 0.05), 0 4px 6px -2px rgba(0, 0, 0, 0.02);
-        margin-bottom: 1.25rem;
-        border: 1px solid #f1f5f9;
-        border-left: 8px solid #3b82f6;
-    }
-
-    .trade-card.profit { border-left-color: #10b981; }
-    .trade-card.loss { border-left-color: #ef4444; }
-
-    /* Metrics Refinement */
-    div[data-testid="stMetric"] {
-        background: white !important;
-        padding: 1.25rem !important;
-        border-radius: 16px;
-        border: 1px solid #e2e8f0;
-        box-shadow: 0 4px 6px -1px rgba(0,0,0,0.05);
-    }
-    
-    div[data-testid="stMetricLabel"] p {
-        color: #64748b !important;
-        font-weight: 500 !important;
-    }
-    
-    div[data-testid="stMetricValue"] {
-        color: #0f172a !important;
-        font-size: 1.6rem !important;
-        font-weight: 800 !important;
-    }
-
-    /* Mobile Friendly Buttons - Force High Contrast Visibility */
-    .stButton > button {
-        width: 100% !important;
-        height: 3.8rem !important;
-        border-radius: 14px !important;
-        font-weight: 700 !important;
-        font-size: 1.1rem !important;
-        background-color: #1e293b !important; /* Dark Slate Blue */
-        color: #ffffff !important; /* FORCED BRIGHT WHITE TEXT */
-        border: none !important;
-        box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1) !important;
-        display: block !important;
-    }
-
-    .stButton > button p {
-        color: #ffffff !important; /* Primary fix for button text visibility */
-        font-weight: 700 !important;
-    }
-
-    .stButton > button:active {
-        transform: scale(0.97) !important;
-        background-color: #334155 !important;
-    }
-
-    /* Fix Input Fields - Removed Dark Blocks */
-    .stTextInput input, .stNumberInput input, .stSelectbox [data-baseweb="select"] {
-        background-color: #ffffff !important;
-        color: #0f172a !important;
-        height: 3.8rem !important;
-        border-radius: 14px !important;
-        border: 2px solid #e2e8f0 !important;
-        font-size: 1.1rem !important;
-    }
-    
-    .stTextInput input:focus, .stNumberInput input:focus {
-        border-color: #3b82f6 !important;
-        box-shadow: 0 0 0 3px rgba(59, 130, 246, 0.1) !important;
-    }
-
-    /* Tab Optimization */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 8px;
-        background-color: #f1f5f9;
-        padding: 6px;
-        border-radius: 14px;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        flex-grow: 1;
-        background-color: transparent !important;
-        border-radius: 10px !important;
-        color: #64748b !important;
-        font-weight: 600 !important;
-        border: none !important;
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background-color: white !important;
-        color: #0f172a !important;
-        box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.05) !important;
-    }
-
-    /* Sidebar Overhaul - Fix Black-on-Black */
-    [data-testid="stSidebar"] {
-        background-color: #ffffff !important;
-        border-right: 1px solid #e2e8f0;
-    }
-    
-    [data-testid="stSidebar"] [data-testid="stMarkdownContainer"] p, 
-    [data-testid="stSidebar"] .stRadio label {
-        color: #1e293b !important;
-        font-weight: 600 !important;
-    }
-
-    [data-testid="stSidebar"] h1, [data-testid="stSidebar"] h2, [data-testid="stSidebar"] h3 {
-        color: #0f172a !important;
-    }
-
-    /* Radio Button Navigation in Sidebar */
-    [data-testid="stSidebar"] .stRadio > div {
-        background-color: #f8fafc !important;
-        padding: 12px !important;
-        border-radius: 12px !important;
-        border: 1px solid #e2e8f0 !important;
-    }
-
-    [aria-selected="true"] {
-        background-color: #3b82f6 !important;
-        color: white !important;
-        border-radius: 8px !important;
-    }
-
-    /* Input Field Fixes */
-    .stTextInput input, .stNumberInput input, .stSelectbox [data-baseweb="select"] {
-        background-color: #ffffff !important;
-        color: #0f172a !important;
-        height: 3.5rem !important;
-        border-radius: 12px !important;
-        border: 2px solid #e2e8f0 !important;
-        font-size: 1.1rem !important;
-    }
-    </style>
-""", unsafe_allow_html=True)
+# Custom CSS for Mobile-First Enterprise Look (Streamlit drops elements a rerun does not re-emit)
+st.markdown(f"<style>{stylesheet()}</style>", unsafe_allow_html=True)
 
 # --- SESSION STATE & AUTH ---
 
@@ -199,6 +41,31 @@ if 'user_id' not in st.session_state:
 if 'username' not in st.session_state:
     st.session_state.username = None
 
+def set_session_cookie(token):
+    """Queues the session cookie (None clears it) for the browser; written on the next script run."""
+    st.session_state.session_cookie = token or ""
+
+# Restore a signed-in session after a browser refresh without another bcrypt check. The token
+# lives in a cookie rather than the URL, so it stays out of browser history and Referer
+# headers; st.context.cookies holds what the browser sent when this session connected
+if 'session_restored' not in st.session_state:
+    st.session_state.session_restored = True
+    token = st.context.cookies.get(SESSION_COOKIE)
+    if token:
+        uid, uname = auth.verify_session_token(token)
+        if uid:
+            st.session_state.user_id = uid
+            st.session_state.username = uname
+        else:
+            set_session_cookie(None)
+
+if 'session_cookie' in st.session_state:
+    # Streamlit cannot set cookies itself; a script in a same-origin iframe sets it on the app page
+    token = st.session_state.pop('session_cookie')
+    cookie = f"{SESSION_COOKIE}={token}; max-age={int(auth.SESSION_HOURS * 3600) if token else 0}; path=/; SameSite=Strict"
+    st.iframe(f"<script>parent.document.cookie = {json.dumps(cookie)}"
+              f" + (parent.location.protocol === 'https:' ? '; Secure' : '');</script>", height=1)
+
 # --- AUTHENTICATION ---
 def login_page():
     col1, col2, col3 = st.columns([1,2,1])
@@ -214,14 +81,18 @@ def login_page():
             password = st.text_input("Password", type="password", key="login_pass")
             if st.button("Access Dashboard", type="primary"):
                 with st.spinner("Authenticating..."):
-                    time.sleep(0.5) # Fake delay for effect
-                    uid, uname = db.authenticate_user(username, password)
-                    if uid:
-                        st.session_state.user_id = uid
-                        st.session_state.username = uname
-                        st.rerun()
+                    try:
+                        uid, uname = auth.login(username, password).result()
+                    except auth.RateLimitError as e:
+                        st.error(f"Too many failed attempts. Try again in {e.retry_after:.0f}s.")
                     else:
-                        st.error("Invalid credentials")
+                        if uid:
+                            st.session_state.user_id = uid
+                            st.session_state.username = uname
+                            set_session_cookie(auth.issue_session_token(uid, uname))
+                            st.rerun()
+                        else:
+                            st.error("Invalid credentials")
                 
         with tab2:
             st.write("")
@@ -229,7 +100,7 @@ def login_page():
             new_pass = st.text_input("Choose Password", type="password", key="reg_pass")
             if st.button("Create Account"):
                 if new_user and new_pass:
-                    if db.create_user(new_user, new_pass):
+                    if auth.register(new_user, new_pass).result():
                         st.success("Account created successfully! Please log in.")
                     else:
                         st.error("Username already taken.")
@@ -238,6 +109,8 @@ def login_page():
 
 # --- MAIN APP ---
 def main_app():
+    # pandas/numpy come in with analytics; the login page renders without them
+    import analytics
     # Sidebar
     with st.sidebar:
         st.title("TradeFlow Pro 🏢")
@@ -245,7 +118,10 @@ def main_app():
         st.markdown("---")
         
         # Navigation
-        page = st.radio("Enterprise Navigation", ["Active Dashboard", "Advanced Analytics", "Trade History"])
+        pages = ["Active Dashboard", "Advanced Analytics", "Trade History"]
+        if instrumentation.is_admin(st.session_state.username):
+            pages.append("System Telemetry")
+        page = st.radio("Enterprise Navigation", pages)
         
         st.markdown("---")
         with st.expander("🛠️ Account Maintenance"):
@@ -253,180 +129,322 @@ def main_app():
                 db.delete_user_data(st.session_state.username)
                 st.session_state.user_id = None
                 st.session_state.username = None
+                set_session_cookie(None)
+                st.session_state.pop("trades_sync", None)
+                st.session_state.pop("series_view", None)
                 st.success("Account successfully deleted.")
                 time.sleep(1)
                 st.rerun()
 
         if st.button("Logout System"):
+            # Server-side revocation: a token copied out of this browser's cookie stops working too
+            auth.logout(st.session_state.user_id)
             st.session_state.user_id = None
             st.session_state.username = None
+            set_session_cookie(None)
+            st.session_state.pop("trades_sync", None)
+            st.session_state.pop("series_view", None)
             st.rerun()
     
-    # FETCH DATA
-    df = db.get_user_trades(st.session_state.user_id)
-    if not df.empty:
-        df['date_dt'] = pd.to_datetime(df['date'])
-        df['month_period'] = df['date_dt'].dt.to_period('M')
-        df['month_year'] = df['date_dt'].dt.strftime('%b %Y')
-
-    if page == "Active Dashboard":
-        st.title("Trading Floor")
-        
-        # 1. NEW ENTRY SECTION
-        with st.expander("🆕 Register New Transaction", expanded=True):
-            col1, col2 = st.columns(2)
-            with col1:
-                trade_date = st.date_input("Execution Date", date.today())
-                
-                # Dynamic Event Dropdown Logic - CLEAN (NO DEFAULTS)
-                user_events = db.get_unique_events(st.session_state.user_id)
-                all_options = sorted(user_events) + ["<Add New Entry Type>"]
+    # FETCH DATA: pages render from SQL aggregates; Trade History reads the trade list a page at a
+    # time and Advanced Analytics keeps a synced copy in the session
+    totals = db.get_trade_totals(st.session_state.user_id)
+    has_trades = totals['trades'] > 0
+
+    with instrumentation.timed(f"page.{page}"):
+        if page == "Active Dashboard":
+            st.title("Trading Floor")
+            
+            # 1. NEW ENTRY SECTION
+            with st.expander("🆕 Register New Transaction", expanded=True):
+                col1, col2 = st.columns(2)
+                with col1:
+                    trade_date = st.date_input("Execution Date", date.today())
+                    
+                    # Dynamic Event Dropdown Logic - CLEAN (NO DEFAULTS)
+                    user_events = db.get_unique_events(st.session_state.user_id)
+                    all_options = sorted(user_events) + ["<Add New Entry Type>"]
+                    
+                    # Default selection logic
+                    index = (len(all_options)-1) # Default to Add New
+                    if has_trades:
+                        newest, _ = db.get_trades_page(st.session_state.user_id, page_size=1)
+                        last_event = newest.iloc[0]['event']
+                        if last_event in all_options:
+                            index = all_options.index(last_event)
+                    
+                    event_choice = st.selectbox("Symbol / Market Group", all_options, index=index)
+                    
+                    final_event = event_choice
+                    if event_choice == "<Add New Entry Type>":
+                        final_event = st.text_input("Enter Label (e.g. BTC, ASX, NYSE)").upper()
                 
-                # Default selection logic
-                index = (len(all_options)-1) # Default to Add New
-                if not df.empty:
-                    last_event = df.iloc[0]['event']
-                    if last_event in all_options:
-                        index = all_options.index(last_event)
+                with col2:
+                    spent = st.number_input("Capital Deployed ($)", min_value=0.0, step=100.0)
+                    earned = st.number_input("Gross Return ($)", min_value=0.0, step=100.0)
                 
-                event_choice = st.selectbox("Symbol / Market Group", all_options, index=index)
+                if st.button("Commit to Ledger", type="primary", use_container_width=True):
+                    if final_event and final_event != "<Add New Entry Type>":
+                        # Returns once the queued write has been group-committed
+                        db.submit_trade(st.session_state.user_id, trade_date, final_event, spent, earned).result()
+                        st.toast(f"Ledger Updated: {final_event}", icon="🚀")
+                        st.rerun()
+                    else:
+                        st.warning("Please define the market type.")
+
+            # 2. BULK IMPORT
+            with st.expander("📥 Bulk Import (CSV / Broker Export)"):
+                st.caption("Columns: date, event, spent, earned. Common broker headers such as Symbol, Cost and Proceeds are recognised.")
+                upload = st.file_uploader("Trade File", type=["csv"])
+                if upload is not None and st.button("Import Trades", use_container_width=True):
+                    bar = st.progress(0.0, text="Importing...")
+                    
+                    def on_progress(rows_read):
+                        bar.progress(min(upload.tell() / max(upload.size, 1), 1.0), text=f"{rows_read:,} rows processed")
+                    
+                    try:
+                        result = db.import_trades_csv(st.session_state.user_id, upload, progress=on_progress)
+                    except ValueError as e:
+                        st.error(str(e))
+                    else:
+                        bar.progress(1.0, text="Import complete")
+                        st.success(f"Imported {result['inserted']:,} trades.")
+                        if result['rejected']:
+                            st.warning(f"{result['rejected']:,} rows were rejected.")
+                            st.dataframe(result['rejected_rows'], use_container_width=True)
+
+            # Quick Health Check
+            if has_trades:
+                st.markdown("### Portfolio Pulse")
+                pulse = analytics.summary_metrics(totals)
                 
-                final_event = event_choice
-                if event_choice == "<Add New Entry Type>":
-                    final_event = st.text_input("Enter Label (e.g. BTC, ASX, NYSE)").upper()
-            
-            with col2:
-                spent = st.number_input("Capital Deployed ($)", min_value=0.0, step=100.0)
-                earned = st.number_input("Gross Return ($)", min_value=0.0, step=100.0)
+                m1, m2, m3, m4 = st.columns(4)
+                m1.metric("Lifetime Investment", f"${pulse['spent']:,.2f}")
+                m2.metric("Net Yield", f"${pulse['pnl']:,.2f}", delta=f"{pulse['roi']:.1f}%")
+                m3.metric("Win Rate", f"{pulse['win_rate']:.1f}%")
+                m4.metric("Entry Count", f"{pulse['count']}")
+
+        elif page == "Advanced Analytics":
+            import plotly.express as px
+            st.title("Enterprise Reporting Engine")
             
-            if st.button("Commit to Ledger", type="primary", use_container_width=True):
-                if final_event and final_event != "<Add New Entry Type>":
-                    db.add_trade(st.session_state.user_id, trade_date, final_event, spent, earned)
-                    st.toast(f"Ledger Updated: {final_event}", icon="🚀")
-                    time.sleep(1)
-                    st.rerun()
+            if not has_trades:
+                st.warning("No data found. Please log trades to view analytics.")
+            else:
+                # 1. MARKET SELECTOR
+                all_markets = db.get_unique_events(st.session_state.user_id)
+                market_filter = st.selectbox("Market Segmentation View", ["🌍 Global Portfolio"] + all_markets)
+                
+                # Pre-aggregated monthly rows from the rollup table
+                market_event = None if market_filter == "🌍 Global Portfolio" else market_filter
+                monthly_agg = db.get_monthly_rollups(st.session_state.user_id, market_event)
+                
+                # 2. SECTOR SPECIFIC STATS
+                st.markdown(f"#### Performance Parameters: {market_filter}")
+                s1, s2, s3, s4 = st.columns(4)
+                # The session keeps its trades frame and only pulls rows added or deleted since the
+                # last rerun; the order-dependent metrics come from it, the totals from SQL
+                st.session_state.trades_sync = db.sync_user_trades(st.session_state.user_id,
+                                                                   st.session_state.get('trades_sync'))
+                # Recomputed only when the synced data or the market changes
+                view = (st.session_state.trades_sync['version'], market_event)
+                if st.session_state.get('series_view', {}).get('key') != view:
+                    series = analytics.pnl_series(st.session_state.trades_sync['trades'], market_event)
+                    st.session_state.series_view = {
+                        'key': view,
+                        'metrics': analytics.ledger_metrics(db.get_trade_totals(st.session_state.user_id, market_event), series),
+                        'roll': analytics.rolling_roi(series),
+                    }
+                seg = st.session_state.series_view['metrics']
+                
+                s1.metric("Total Deployment", f"${seg['spent']:,.2f}")
+                s2.metric("Gross Revenue", f"${seg['earned']:,.2f}")
+                s3.metric("Net Profit/Loss", f"${seg['pnl']:,.2f}", delta=f"{seg['roi']:.2f}%")
+                s4.metric("Avg Trade Size", f"${seg['avg_trade']:,.2f}")
+
+                r1, r2, r3, r4 = st.columns(4)
+                r1.metric("Win Rate", f"{seg['win_rate']:.1f}%")
+                r2.metric("Profit Factor", "∞" if seg['profit_factor'] == float('inf') else f"{seg['profit_factor']:.2f}")
+                r3.metric("Max Drawdown", f"${seg['max_drawdown']:,.2f}", delta=f"-{seg['max_drawdown_pct']:.1f}%", delta_color="off")
+                streak = seg['current_streak']
+                r4.metric("Best Win Streak", f"{seg['longest_win_streak']}",
+                          delta=f"{'W' if streak > 0 else 'L'}{abs(streak)} current" if streak else None)
+
+                # Rolling ROI over the last ROLLING_WINDOW trades
+                roll = st.session_state.series_view['roll']
+                fig_roll = px.line(roll, x='trade_no', y='rolling_roi',
+                                   labels={'trade_no': 'Trade #', 'rolling_roi': f'Rolling ROI, {analytics.ROLLING_WINDOW} trades (%)'})
+                fig_roll.update_traces(line_color='#6f42c1', line_width=2)
+                fig_roll.update_layout(template="plotly_white", height=250)
+                st.plotly_chart(fig_roll, use_container_width=True)
+
+                if market_event is None:
+                    with st.expander("🧭 Per-Market Breakdown"):
+                        markets_out = analytics.user_market_breakdown(st.session_state.user_id).copy()
+                        markets_out.columns = ['Market', 'Trades', 'Total Spent', 'Total Earned', 'Net P&L', 'ROI %', 'Win Rate %']
+                        st.dataframe(markets_out, hide_index=True, use_container_width=True)
+
+                st.markdown("---")
+
+                # 3. MONTHLY SEGMENTATION (P&L Reporting)
+                st.markdown("### 📊 Monthly Enterprise Reports")
+                
+                monthly_agg = analytics.monthly_report(monthly_agg)
+                
+                # Monthly Visualization
+                col_left, col_right = st.columns(2)
+                
+                with col_left:
+                    st.markdown("**Individual Monthly P&L**")
+                    fig_m_bar = px.bar(
+                        monthly_agg, x='month_label', y='pnl',
+                        color='pnl', color_continuous_scale=['#ff4b4b', '#00cc96'],
+                        labels={'pnl': 'Net P&L ($)', 'month_label': 'Reporting Period'}
+                    )
+                    fig_m_bar.update_layout(template="plotly_white", showlegend=False, height=350)
+                    st.plotly_chart(fig_m_bar, use_container_width=True)
+
+                with col_right:
+                    st.markdown("**Cumulative Monthly Growth**")
+                    fig_c_line = px.line(
+                        monthly_agg, x='month_label', y='cumulative_pnl',
+                        markers=True, labels={'cumulative_pnl': 'Cumul. P&L ($)'}
+                    )
+                    fig_c_line.update_traces(line_color='#007bff', line_width=4, fill='tozeroy')
+                    fig_c_line.update_layout(template="plotly_white", height=350)
+                    st.plotly_chart(fig_c_line, use_container_width=True)
+
+                # 4. DATA TABLE
+                with st.expander("📄 Export Monthly Ledger Data"):
+                    table_out = monthly_agg[['month_label', 'spent', 'earned', 'pnl', 'cumulative_pnl']].copy()
+                    table_out.columns = ['Period', 'Total Spent', 'Total Earned', 'Monthly P&L', 'Cumulative Growth']
+                    st.dataframe(table_out, hide_index=True, use_container_width=True)
+
+                with st.expander("📦 Export Full Trade Ledger"):
+                    e1, e2 = st.columns(2)
+                    with e1:
+                        # Parquet needs the optional pyarrow package
+                        formats = ["CSV", "Parquet"] if importlib.util.find_spec("pyarrow") else ["CSV"]
+                        export_fmt = st.radio("Format", formats, horizontal=True)
+                        export_market = st.selectbox("Market", ["All Markets"] + all_markets, key="export_market")
+                    with e2:
+                        export_range = st.date_input("Date Range (optional)", value=(), key="export_range")
+                    
+                    fmt = export_fmt.lower()
+                    start = export_range[0] if len(export_range) > 0 else None
+                    # A start date on its own exports everything from that day on
+                    end = export_range[1] if len(export_range) > 1 else None
+                    # Read up front: the callable runs on a worker thread without the script's session state
+                    export_user = st.session_state.user_id
+                    export_event = None if export_market == "All Markets" else export_market
+                    
+                    def build_export():
+                        # Runs only when the download is clicked. download_button serves bytes, so the
+                        # finished file is held in memory; export_trades still reads SQLite in chunks
+                        out = io.BytesIO()
+                        db.export_trades(export_user, out, fmt, start=start, end=end, event=export_event)
+                        return out.getvalue()
+                    
+                    st.download_button(
+                        "Download Ledger", data=build_export,
+                        file_name=f"tradeflow_{st.session_state.username}.{fmt}",
+                        mime="text/csv" if fmt == "csv" else "application/octet-stream",
+                        use_container_width=True
+                    )
+
+        elif page == "Trade History":
+            st.title("Transaction History")
+            if not has_trades:
+                st.info("No records to display.")
+            else:
+                search_query = st.text_input("Search Assets...", placeholder="e.g. BTC")
+                
+                # Keyset pagination: keep the start cursor of every page visited so far
+                if st.session_state.get('history_search') != search_query or 'history_cursors' not in st.session_state:
+                    st.session_state.history_search = search_query
+                    st.session_state.history_cursors = [None]
+                cursors = st.session_state.history_cursors
+                
+                if search_query:
+                    display_df, next_cursor = db.search_trades(st.session_state.user_id, search_query, cursor=cursors[-1])
                 else:
-                    st.warning("Please define the market type.")
-
-        # Quick Health Check
-        if not df.empty:
-            st.markdown("### Portfolio Pulse")
-            tot_s = df['spent'].sum()
-            tot_p = df['pnl'].sum()
-            tot_roi = (tot_p / tot_s * 100) if tot_s > 0 else 0
-            
-            m1, m2, m3 = st.columns(3)
-            m1.metric("Lifetime Investment", f"${tot_s:,.2f}")
-            m2.metric("Net Yield", f"${tot_p:,.2f}", delta=f"{tot_roi:.1f}%")
-            m3.metric("Entry Count", f"{len(df)}")
-
-    elif page == "Advanced Analytics":
-        st.title("Enterprise Reporting Engine")
-        
-        if df.empty:
-            st.warning("No data found. Please log trades to view analytics.")
-        else:
-            # 1. MARKET SELECTOR
-            all_markets = sorted(df['event'].unique().tolist())
-            market_filter = st.selectbox("Market Segmentation View", ["🌍 Global Portfolio"] + all_markets)
-            
-            report_df = df if market_filter == "🌍 Global Portfolio" else df[df['event'] == market_filter]
-            
-            # 2. SECTOR SPECIFIC STATS
-            st.markdown(f"#### Performance Parameters: {market_filter}")
-            s1, s2, s3, s4 = st.columns(4)
-            r_s = report_df['spent'].sum()
-            r_e = report_df['earned'].sum()
-            r_p = report_df['pnl'].sum()
-            r_roi = (r_p / r_s * 100) if r_s > 0 else 0
-            
-            s1.metric("Total Deployment", f"${r_s:,.2f}")
-            s2.metric("Gross Revenue", f"${r_e:,.2f}")
-            s3.metric("Net Profit/Loss", f"${r_p:,.2f}", delta=f"{r_roi:.2f}%")
-            s4.metric("Avg Trade Size", f"${report_df['spent'].mean():,.2f}")
-
-            st.markdown("---")
-
-            # 3. MONTHLY SEGMENTATION (P&L Reporting)
-            st.markdown("### 📊 Monthly Enterprise Reports")
-            
-            # Aggregate Monthly Stats
-            monthly_agg = report_df.groupby('month_period').agg({
-                'spent': 'sum',
-                'earned': 'sum',
-                'pnl': 'sum'
-            }).reset_index().sort_values('month_period')
-            
-            monthly_agg['month_label'] = monthly_agg['month_period'].dt.strftime('%b %Y')
-            monthly_agg['cumulative_pnl'] = monthly_agg['pnl'].cumsum()
-            
-            # Monthly Visualization
-            col_left, col_right = st.columns(2)
-            
-            with col_left:
-                st.markdown("**Individual Monthly P&L**")
-                fig_m_bar = px.bar(
-                    monthly_agg, x='month_label', y='pnl',
-                    color='pnl', color_continuous_scale=['#ff4b4b', '#00cc96'],
-                    labels={'pnl': 'Net P&L ($)', 'month_label': 'Reporting Period'}
-                )
-                fig_m_bar.update_layout(template="plotly_white", showlegend=False, height=350)
-                st.plotly_chart(fig_m_bar, use_container_width=True)
-
-            with col_right:
-                st.markdown("**Cumulative Monthly Growth**")
-                fig_c_line = px.line(
-                    monthly_agg, x='month_label', y='cumulative_pnl',
-                    markers=True, labels={'cumulative_pnl': 'Cumul. P&L ($)'}
-                )
-                fig_c_line.update_traces(line_color='#007bff', line_width=4, fill='tozeroy')
-                fig_c_line.update_layout(template="plotly_white", height=350)
-                st.plotly_chart(fig_c_line, use_container_width=True)
-
-            # 4. DATA TABLE
-            with st.expander("📄 Export Monthly Ledger Data"):
-                table_out = monthly_agg[['month_label', 'spent', 'earned', 'pnl', 'cumulative_pnl']].copy()
-                table_out.columns = ['Period', 'Total Spent', 'Total Earned', 'Monthly P&L', 'Cumulative Growth']
-                st.dataframe(table_out, hide_index=True, use_container_width=True)
-
-    elif page == "Trade History":
-        st.title("Transaction History")
-        if df.empty:
-            st.info("No records to display.")
-        else:
-            search_query = st.text_input("Search Assets...", placeholder="e.g. BTC")
-            display_df = df[df['event'].str.contains(search_query, case=False)] if search_query else df
-            
-            for _, row in display_df.iterrows():
-                sts = "profit" if row['pnl'] >= 0 else "loss"
-                p_col = "#00cc96" if row['pnl'] >= 0 else "#ff4b4b"
+                    display_df, next_cursor = db.get_trades_page(st.session_state.user_id, cursors[-1])
+                if display_df.empty:
+                    st.info("No matching records.")
                 
-                card_html = f"""
-                <div class="trade-card {sts}">
-                    <div style="display:flex; justify-content:space-between; align-items:center;">
-                        <div>
-                            <span style="font-weight:bold; color:#333;">{row['event']}</span>
-                            <div style="font-size:0.8em; color:#888;">{row['date']}</div>
-                        </div>
-                        <div style="text-align:right;">
-                            <div style="font-size:1.1em; font-weight:bold; color:{p_col};">
-                                {'+' if row['pnl'] > 0 else ''}${row['pnl']:,.2f}
+                for _, row in display_df.iterrows():
+                    pnl, spent, earned = row['pnl_cents'] / 100, row['spent_cents'] / 100, row['earned_cents'] / 100
+                    sts = "profit" if pnl >= 0 else "loss"
+                    p_col = "#00cc96" if pnl >= 0 else "#ff4b4b"
+                    
+                    card_html = f"""
+                    <div class="trade-card {sts}">
+                        <div style="display:flex; justify-content:space-between; align-items:center;">
+                            <div>
+                                <span style="font-weight:bold; color:#333;">{row['event']}</span>
+                                <div style="font-size:0.8em; color:#888;">{db.key_to_date(row['date'])}</div>
+                            </div>
+                            <div style="text-align:right;">
+                                <div style="font-size:1.1em; font-weight:bold; color:{p_col};">
+                                    {'+' if pnl > 0 else ''}${pnl:,.2f}
+                                </div>
+                                <div style="font-size:0.75em; color:#999;">S: ${spent:,.2f} | E: ${earned:,.2f}</div>
                             </div>
-                            <div style="font-size:0.75em; color:#999;">S: ${row['spent']:,.2f} | E: ${row['earned']:,.2f}</div>
                         </div>
                     </div>
-                </div>
-                """
-                
-                c_data, c_del = st.columns([0.9, 0.1])
-                with c_data:
-                    st.markdown(card_html, unsafe_allow_html=True)
-                with c_del:
-                    st.write("")
-                    if st.button("✕", key=f"del_{row['id']}"):
-                        db.delete_trade(row['id'], st.session_state.user_id)
+                    """
+                    
+                    c_data, c_del = st.columns([0.9, 0.1])
+                    with c_data:
+                        st.markdown(card_html, unsafe_allow_html=True)
+                    with c_del:
+                        st.write("")
+                        if st.button("✕", key=f"del_{row['id']}"):
+                            db.submit_delete(int(row['id']), st.session_state.user_id).result()
+                            st.rerun()
+
+                # Page Navigation
+                n_prev, n_label, n_next = st.columns([1, 2, 1])
+                with n_prev:
+                    if st.button("← Newer", disabled=len(cursors) == 1):
+                        cursors.pop()
+                        st.rerun()
+                with n_label:
+                    st.markdown(f"<div style='text-align:center; padding-top:1rem;'>Page {len(cursors)}</div>", unsafe_allow_html=True)
+                with n_next:
+                    if st.button("Older →", disabled=next_cursor is None):
+                        cursors.append(next_cursor)
                         st.rerun()
 
+        elif page == "System Telemetry":
+            st.title("System Telemetry")
+            st.caption(f"Slow-query threshold: {instrumentation.SLOW_QUERY_MS:.0f} ms · Log: {instrumentation.SLOW_LOG_PATH}")
+            
+            report = instrumentation.latency_report()
+            if report:
+                st.dataframe(report, hide_index=True, use_container_width=True)
+            else:
+                st.info("No samples recorded yet.")
+            
+            st.markdown("#### Read Cache")
+            st.json(db.cache_stats())
+            
+            st.markdown("#### Write Queue")
+            st.json(db.write_queue_stats())
+            
+            st.markdown("#### Database Maintenance")
+            report = maintenance.last_report()
+            if report:
+                st.json(report)
+            else:
+                st.caption(f"No maintenance run yet in this process (every {maintenance.INTERVAL_S:.0f}s).")
+            if st.button("Run Maintenance Now"):
+                maintenance.run_maintenance()
+                st.rerun()
+            if st.button("Reset Samples"):
+                instrumentation.reset()
+                st.rerun()
+
 # --- DISPATCHER ---
 if st.session_state.user_id:
     main_app()
@@ -0,0 +1,186 @@
+"""Login handling around db_manager: bcrypt off the script thread, rate limits and session tokens.
+
+bcrypt work runs on a small bounded thread pool (bcrypt releases the GIL), so a login spike
+queues for a few workers instead of tying up every Streamlit script thread. Successful
+logins get an HMAC-signed session token that survives a browser refresh without another
+bcrypt verification; logout revokes all of a user's tokens server-side.
+
+    TRADEFLOW_AUTH_WORKERS        bcrypt worker threads (default 4)
+    TRADEFLOW_SECRET_KEY          token signing key (default: generated into .tradeflow_secret)
+    TRADEFLOW_SESSION_HOURS       session token lifetime (default 12)
+    TRADEFLOW_LOGIN_MAX_FAILURES  failed logins allowed per username per window (default 5)
+    TRADEFLOW_LOGIN_WINDOW_S      rate-limit window in seconds (default 300)
+"""
+import atexit
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import db_manager as db
+
+AUTH_WORKERS = int(os.environ.get("TRADEFLOW_AUTH_WORKERS", "4"))
+SESSION_HOURS = float(os.environ.get("TRADEFLOW_SESSION_HOURS", "12"))
+LOGIN_MAX_FAILURES = int(os.environ.get("TRADEFLOW_LOGIN_MAX_FAILURES", "5"))
+LOGIN_WINDOW_S = float(os.environ.get("TRADEFLOW_LOGIN_WINDOW_S", "300"))
+SECRET_PATH = os.path.join(os.path.dirname(__file__), ".tradeflow_secret")
+
+class RateLimitError(Exception):
+    """Too many failed logins for a username; `retry_after` is in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many failed login attempts, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+_pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="tradeflow-auth")
+atexit.register(_pool.shutdown, wait=False)
+
+_failures = {}     # username -> failure times within the window; a username goes once they expire
+_in_flight = {}    # username -> logins handed to the pool and not yet verified; dropped at zero
+_failures_lock = threading.Lock()
+_last_sweep = 0.0
+
+def _recent_failures(username, now):
+    attempts = _failures.get(username)
+    if attempts is None:
+        return None
+    while attempts and attempts[0] <= now - LOGIN_WINDOW_S:
+        attempts.popleft()
+    if not attempts:
+        del _failures[username]
+        return None
+    return attempts
+
+def _sweep(now):
+    # Usernames tried once and never again would otherwise stay forever; at most one pass per window
+    global _last_sweep
+    if now - _last_sweep < LOGIN_WINDOW_S:
+        return
+    _last_sweep = now
+    for username in [u for u, attempts in _failures.items() if attempts[-1] <= now - LOGIN_WINDOW_S]:
+        del _failures[username]
+
+def _reserve_attempt(username):
+    """Counts a login against the limit before bcrypt runs, so parallel guesses cannot all pass
+    the check. Raises RateLimitError when failures plus in-flight attempts reach the limit."""
+    now = time.monotonic()
+    with _failures_lock:
+        _sweep(now)
+        attempts = _recent_failures(username, now)
+        pending = _in_flight.get(username, 0)
+        if len(attempts or ()) + pending >= LOGIN_MAX_FAILURES:
+            # Attempts still in flight become failures about now, a full window from here
+            raise RateLimitError(attempts[0] + LOGIN_WINDOW_S - now if attempts else LOGIN_WINDOW_S)
+        _in_flight[username] = pending + 1
+
+def _record_result(username, ok):
+    """Releases a reserved attempt: success clears the failures, a failure is recorded, None (an error) neither."""
+    with _failures_lock:
+        pending = _in_flight.pop(username, 1) - 1
+        if pending:
+            _in_flight[username] = pending
+        if ok:
+            _failures.pop(username, None)
+        elif ok is not None:
+            attempts = _recent_failures(username, time.monotonic())
+            if attempts is None:
+                attempts = _failures[username] = deque()
+            attempts.append(time.monotonic())
+
+def _login(username, password):
+    ok = None
+    try:
+        uid, uname = db.authenticate_user(username, password)
+        ok = uid is not None
+        return uid, uname
+    finally:
+        _record_result(username, ok)
+
+def login(username, password):
+    """Verifies credentials on the auth pool. Returns a Future of (user_id, username) / (None, None).
+
+    Raises RateLimitError straight away, without touching bcrypt, once a username's failed
+    and pending attempts use up LOGIN_MAX_FAILURES for the window.
+    """
+    _reserve_attempt(username)
+    try:
+        return _pool.submit(_login, username, password)
+    except RuntimeError:
+        _record_result(username, None)   # pool shut down at exit
+        raise
+
+def register(username, password):
+    """Creates an account on the auth pool. Returns a Future of db.create_user's result."""
+    return _pool.submit(db.create_user, username, password)
+
+def _secret_key():
+    key = os.environ.get("TRADEFLOW_SECRET_KEY")
+    if key:
+        return key.encode('utf-8')
+    try:
+        with open(SECRET_PATH, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        key = secrets.token_bytes(32)
+        try:
+            fd = os.open(SECRET_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            # Another process generated it first
+            with open(SECRET_PATH, "rb") as f:
+                return f.read()
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        return key
+
+_key = None
+_key_lock = threading.Lock()
+
+def _signing_key():
+    global _key
+    with _key_lock:
+        if _key is None:
+            _key = _secret_key()
+        return _key
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def issue_session_token(user_id, username):
+    # `g` ties the token to the account's current session generation, so logout can revoke it
+    account = db.get_session_generation(user_id)
+    claims = {'uid': user_id, 'u': username, 'g': account[1] if account else 0,
+              'exp': int(time.time() + SESSION_HOURS * 3600)}
+    payload = _b64(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    signature = _b64(hmac.new(_signing_key(), payload.encode('ascii'), hashlib.sha256).digest())
+    return f"{payload}.{signature}"
+
+def verify_session_token(token):
+    """(user_id, username) for a valid, unexpired, unrevoked token whose account still exists, else (None, None)."""
+    try:
+        payload, signature = token.split(".")
+        expected = _b64(hmac.new(_signing_key(), payload.encode('ascii'), hashlib.sha256).digest())
+        if not hmac.compare_digest(signature, expected):
+            return None, None
+        claims = json.loads(_unb64(payload))
+    except (ValueError, AttributeError, UnicodeError):
+        return None, None
+    if claims.get('exp', 0) < time.time():
+        return None, None
+    if not isinstance(claims.get('uid'), int):
+        return None, None
+    if db.get_session_generation(claims['uid']) != (claims.get('u'), claims.get('g')):
+        return None, None
+    return claims['uid'], claims['u']
+
+def logout(user_id):
+    """Revokes every session token issued to the user, including cookies held by other browsers."""
+    db.revoke_sessions(user_id)
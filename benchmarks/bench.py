@@ -0,0 +1,494 @@
+"""Synthetic-load benchmarks for db_manager and the dashboard page computations.
+
+    python benchmarks/bench.py                                  # run, compare against baseline.json
+    python benchmarks/bench.py --users 1000 --trades 10000      # smaller fixture
+    python benchmarks/bench.py --save-baseline                  # record a new baseline
+
+Builds a deterministic tradeflow.db in a temporary directory, times every db_manager entry
+point and the headless page logic, then runs mixed read/write load from several threads and
+processes, drives the HTTP API (api.py) from client processes and times cold starts of app.py
+to the login page. Results are written as JSON; any metric that is slower than the baseline by more
+than --tolerance is reported and the exit status is 1.
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import analytics
+import api
+import auth
+import db_manager as db
+import datagen
+import maintenance
+import snapshot
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+MIN_REGRESSION_MS = 0.05   # ignore differences too small to measure reliably
+# Results are only comparable between runs over the same fixture
+FIXTURE_KEYS = ('users', 'trades', 'heavy_trades', 'seed', 'bcrypt_rounds')
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        'n': len(samples),
+        'median_ms': round(statistics.median(samples) * 1000, 4),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 4),
+        'min_ms': round(samples[0] * 1000, 4),
+    }
+
+def timeit(fn, args_iter):
+    """Calls fn(*args) for every args tuple and summarises the wall times."""
+    samples = []
+    for args in args_iter:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return _summary(samples)
+
+def run_functions(fixture, repeat, rng):
+    users = fixture['user_ids']
+    heavy = fixture['heavy_user_id']
+    sample = lambda: [(rng.choice(users),) for _ in range(repeat)]
+    results = {}
+
+    # Reads, bypassing the result cache so the database work itself is measured
+    results['get_user_trades'] = timeit(db.get_user_trades.uncached, sample())
+    results['get_user_trades.heavy'] = timeit(db.get_user_trades.uncached, [(heavy,)] * repeat)
+    results['get_unique_events'] = timeit(db.get_unique_events.uncached, sample())
+    results['get_unique_events.heavy'] = timeit(db.get_unique_events.uncached, [(heavy,)] * repeat)
+    results['get_monthly_rollups.heavy'] = timeit(db.get_monthly_rollups.uncached, [(heavy,)] * repeat)
+    results['get_trade_totals'] = timeit(db.get_trade_totals.uncached, sample())
+    results['get_trade_totals.heavy'] = timeit(db.get_trade_totals.uncached, [(heavy,)] * repeat)
+    results['get_trade_breakdown.event.heavy'] = timeit(db.get_trade_breakdown.uncached, [(heavy, 'event')] * repeat)
+    results['get_pnl_series.heavy'] = timeit(db.get_pnl_series.uncached, [(heavy,)] * repeat)
+    results['get_user_trades.cached'] = timeit(db.get_user_trades, [(heavy,)] * repeat)
+    if snapshot.pa is not None:
+        # Columnar snapshot: the first call builds it, later calls only check for changes
+        results['snapshot.build.heavy'] = timeit(snapshot.refresh, [(heavy, True)])
+        results['snapshot.pnl_series.heavy'] = timeit(snapshot.pnl_series, [(heavy,)] * repeat)
+        results['snapshot.trade_breakdown.event.heavy'] = timeit(snapshot.trade_breakdown, [(heavy, 'event')] * repeat)
+
+    # Writes
+    trade_date = time.strftime("%Y-%m-%d")
+    results['add_trade'] = timeit(
+        db.add_trade, [(rng.choice(users), trade_date, rng.choice(datagen.EVENTS), 100.0, 120.0) for _ in range(repeat)]
+    )
+    with db.get_connection() as conn:
+        recent = conn.execute("SELECT id, user_id FROM trades ORDER BY id DESC LIMIT ?", (repeat,)).fetchall()
+    results['delete_trade'] = timeit(db.delete_trade, recent)
+
+    # Session delta sync: a full initial load, then one write between syncs (only the sync is timed)
+    results['sync_user_trades.full.heavy'] = timeit(db.sync_user_trades, [(heavy,)] * repeat)
+    synced = db.sync_user_trades(heavy)
+    samples = []
+    for _ in range(repeat):
+        db.add_trade(heavy, trade_date, rng.choice(datagen.EVENTS), 100.0, 120.0)
+        start = time.perf_counter()
+        synced = db.sync_user_trades(heavy, synced)
+        samples.append(time.perf_counter() - start)
+    results['sync_user_trades.delta.heavy'] = _summary(samples)
+
+    victims = fixture['usernames'][-min(repeat, len(fixture['usernames']) // 2):]
+    results['delete_user_data'] = timeit(db.delete_user_data, [(name,) for name in victims])
+    # Keep the concurrency runs from writing for deleted accounts (foreign keys reject them)
+    fixture['user_ids'] = fixture['user_ids'][:len(fixture['usernames']) - len(victims)]
+    fixture['usernames'] = fixture['usernames'][:len(fixture['usernames']) - len(victims)]
+    results['run_maintenance'] = timeit(maintenance.run_maintenance, [()])
+
+    # Startup: repeat init_db calls must be free
+    results['init_db.rerun'] = timeit(db.init_db, [()] * repeat)
+
+    alive = fixture['usernames'][:max(1, min(repeat, 20))]
+    results['authenticate_user'] = timeit(db.authenticate_user, [(name, datagen.PASSWORD) for name in alive])
+    return results
+
+def run_pages(fixture, repeat):
+    heavy = fixture['heavy_user_id']
+    results = {}
+    session = {'trades_sync': db.sync_user_trades(heavy)}
+
+    def advanced_analytics_page():
+        # As the page renders it: session frame synced (unchanged data: one lookup), totals,
+        # breakdown and rollups from SQL
+        session['trades_sync'] = db.sync_user_trades(heavy, session['trades_sync'])
+        view = (session['trades_sync']['version'], None)
+        if session.get('series_view', {}).get('key') != view:
+            series = analytics.pnl_series(session['trades_sync']['trades'])
+            session['series_view'] = {'key': view, 'metrics': analytics.ledger_metrics(db.get_trade_totals(heavy), series),
+                                      'roll': analytics.rolling_roi(series)}
+        analytics.user_market_breakdown(heavy)
+        analytics.monthly_report(db.get_monthly_rollups(heavy))
+
+    def portfolio_pulse():
+        analytics.summary_metrics(db.get_trade_totals.uncached(heavy))
+
+    def advanced_analytics():
+        # A cache miss on the SQL reads and the session's derived series
+        db._result_cache.invalidate_user(heavy)
+        session.pop('series_view', None)
+        advanced_analytics_page()
+
+    def advanced_analytics_memoised():
+        # Same page once everything is memoised on the user's data version
+        advanced_analytics_page()
+
+    def trade_history():
+        df, cursor = db.get_trades_page.uncached(heavy)
+        for _ in range(3):   # first page plus a few "Older" clicks
+            df, cursor = db.get_trades_page.uncached(heavy, cursor)
+
+    def trade_history_search():
+        db.search_trades.uncached(heavy, "USD")
+        db.search_trades.uncached(heavy, "US")
+
+    for name, fn in [('page.portfolio_pulse', portfolio_pulse), ('page.advanced_analytics', advanced_analytics),
+                     ('page.advanced_analytics.memoised', advanced_analytics_memoised),
+                     ('page.trade_history', trade_history), ('page.trade_history_search', trade_history_search)]:
+        results[name] = timeit(fn, [()] * repeat)
+    return results
+
+def _mixed_workload(db_path, user_ids, duration, write_ratio, seed):
+    """Runs random reads/writes until `duration` elapses. Used by both threads and processes."""
+    db.DB_PATH = db_path
+    rng = random.Random(seed)
+    trade_date = time.strftime("%Y-%m-%d")
+    reads = writes = errors = 0
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        uid = rng.choice(user_ids)
+        start = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                db.add_trade(uid, trade_date, rng.choice(datagen.EVENTS), 50.0, 55.0)
+                writes += 1
+            else:
+                db.get_user_trades.uncached(uid)
+                reads += 1
+        except sqlite3.OperationalError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return {'reads': reads, 'writes': writes, 'errors': errors, 'latencies': latencies}
+
+def _concurrency_result(parts, duration):
+    latencies = [l for part in parts for l in part['latencies']]
+    ops = sum(part['reads'] + part['writes'] for part in parts)
+    return {
+        'ops_per_sec': round(ops / duration, 1),
+        'reads': sum(part['reads'] for part in parts),
+        'writes': sum(part['writes'] for part in parts),
+        'errors': sum(part['errors'] for part in parts),
+        'latency': _summary(latencies) if latencies else None,
+    }
+
+def _run_threads(users, threads, duration, write_ratio):
+    parts = []
+    def worker(seed):
+        parts.append(_mixed_workload(db.DB_PATH, users, duration, write_ratio, seed))
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return _concurrency_result(parts, duration)
+
+def run_concurrency(fixture, threads, processes, duration, write_ratio):
+    users = fixture['user_ids'] or [fixture['heavy_user_id']]
+    results = {}
+    results[f'threads.{threads}'] = _run_threads(users, threads, duration, write_ratio)
+    # Write-only sessions: measures group commit through the write queue
+    results[f'writes.{threads}'] = _run_threads(users, threads, duration, 1.0)
+
+    if processes:
+        with multiprocessing.get_context("spawn").Pool(processes) as procs:
+            parts = procs.starmap(_mixed_workload,
+                                  [(db.DB_PATH, users, duration, write_ratio, 1000 + i) for i in range(processes)])
+        results[f'processes.{processes}'] = _concurrency_result(parts, duration)
+    return results
+
+def run_auth(fixture, threads, logins):
+    """Concurrent successful logins through auth.login's bounded bcrypt pool."""
+    names = fixture['usernames'][:logins] or [datagen.HEAVY_USER]
+    latencies = []
+    errors = 0
+
+    def client(chunk):
+        nonlocal errors
+        for name in chunk:
+            start = time.perf_counter()
+            uid, _ = auth.login(name, datagen.PASSWORD).result()
+            latencies.append(time.perf_counter() - start)
+            if uid is None:
+                errors += 1
+
+    clients = [threading.Thread(target=client, args=(names[i::threads],)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'ops_per_sec': round(len(names) / elapsed, 1),
+        'logins': len(names),
+        'errors': errors,
+        'latency': _summary(latencies),
+    }
+
+def run_sharded(threads, duration, shards, users=400, trades=40000):
+    """Splits a fresh single-file database into `shards` shards, rebalances it, then runs write-only load."""
+    saved = db.DB_PATH, db.SHARDS
+    db.close_connections()
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="tradeflow-shards-"), "tradeflow.db")
+    db.SHARDS = 1
+    results = {'timings': {}, 'concurrency': {}}
+    try:
+        db.init_db()
+        fixture = datagen.populate(db, users, trades, 0, seed=7)
+        # Turning sharding on adopts every account into shard 0; rebalancing spreads them out
+        db.SHARDS = shards
+        db.init_db()
+        samples = []
+        for user_id, _, dst, _ in db.plan_rebalance(max_moves=users):
+            start = time.perf_counter()
+            db.move_user(user_id, dst)
+            samples.append(time.perf_counter() - start)
+        if samples:
+            results['timings']['move_user'] = _summary(samples)
+        results['concurrency'][f'shards.{shards}.writes.{threads}'] = _run_threads(fixture['user_ids'], threads, duration, 1.0)
+    finally:
+        db.close_connections()
+        db.DB_PATH, db.SHARDS = saved
+    return results
+
+# Runs app.py in a fresh interpreter (Streamlit bare mode) up to the login page
+COLD_START_SCRIPT = """
+import json, runpy, sys, time
+started = time.perf_counter()
+import db_manager as db
+db.DB_PATH = sys.argv[1]
+runpy.run_path(sys.argv[2], run_name="__main__")
+elapsed = time.perf_counter() - started
+print(json.dumps({'seconds': elapsed, 'heavy_modules': [m for m in sys.argv[3:] if m in sys.modules]}))
+"""
+COLD_START_HEAVY = ("pandas", "numpy", "pyarrow", "plotly.express", "analytics")
+
+def run_cold_start(db_path, runs):
+    """Times a fresh process rendering the login page and lists heavy modules it imported on the way."""
+    env = dict(os.environ, PYTHONPATH=ROOT, TRADEFLOW_MAINTENANCE_INTERVAL_S="0")
+    samples, heavy = [], set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT, db_path, os.path.join(ROOT, "app.py"),
+                              *COLD_START_HEAVY], env=env, capture_output=True, text=True, check=True)
+        report = json.loads(out.stdout.strip().splitlines()[-1])
+        samples.append(report['seconds'])
+        heavy.update(report['heavy_modules'])
+    return {'timings': {'cold_start.login': _summary(samples)}, 'heavy_modules': sorted(heavy)}
+
+API_BULK_SIZE = 500   # trades per request in the api.bulk run
+
+def _api_client(port, token, duration, write_ratio, bulk, seed, start_at):
+    """One keep-alive API connection issuing requests until `duration` elapses (client processes)."""
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    headers = {'Authorization': f"Bearer {token}", 'Content-Type': 'application/json'}
+    trade_date = time.strftime("%Y-%m-%d")
+    reads = writes = errors = 0
+    latencies = []
+    time.sleep(max(0.0, start_at - time.time()))   # all clients start together
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if rng.random() < write_ratio:
+            trades = [{'date': trade_date, 'event': rng.choice(datagen.EVENTS), 'spent': 50.0, 'earned': 55.0}
+                      for _ in range(bulk)]
+            if bulk == 1:
+                conn.request("POST", "/api/trades", json.dumps(trades[0]), headers)
+            else:
+                conn.request("POST", "/api/trades/bulk", json.dumps({'trades': trades}), headers)
+            writes += 1
+        else:
+            conn.request("GET", rng.choice(("/api/trades?limit=25", "/api/metrics")), headers=headers)
+            reads += 1
+        response = conn.getresponse()
+        response.read()
+        if response.status >= 400:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    return {'reads': reads, 'writes': writes, 'errors': errors, 'latencies': latencies}
+
+def run_api(fixture, clients, duration, write_ratio):
+    """Sustained requests/s against an in-process API server from `clients` client processes."""
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(api.start_server("127.0.0.1", 0))
+    port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    results = {}
+    try:
+        tokens = []
+        for name in fixture['usernames'][:clients] or [datagen.HEAVY_USER]:
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            conn.request("POST", "/api/token", json.dumps({'username': name, 'password': datagen.PASSWORD}))
+            tokens.append(json.loads(conn.getresponse().read())['token'])
+            conn.close()
+        with multiprocessing.get_context("spawn").Pool(clients) as procs:
+            for name, ratio, bulk in (('submit', 1.0, 1), ('mixed', write_ratio, 1), ('bulk', 1.0, API_BULK_SIZE)):
+                start_at = time.time() + 1.0
+                parts = procs.starmap(_api_client, [(port, tokens[i % len(tokens)], duration, ratio, bulk, 2000 + i, start_at)
+                                                    for i in range(clients)])
+                result = _concurrency_result(parts, duration)
+                if bulk > 1:
+                    result['trades_per_sec'] = round(result['writes'] * bulk / duration, 1)
+                results[f'api.{name}.{clients}'] = result
+    finally:
+        loop.call_soon_threadsafe(server.close)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+    return results
+
+def fixture_mismatches(meta, baseline):
+    """Fixture parameters in which `meta` differs from the baseline's, as readable strings."""
+    recorded = baseline.get('meta', {})
+    return [f"{key}={meta.get(key)} (baseline {recorded.get(key)})"
+            for key in FIXTURE_KEYS if meta.get(key) != recorded.get(key)]
+
+def compare(current, baseline, tolerance):
+    """Lists metrics that got slower (or lower-throughput) than the baseline by more than `tolerance`.
+
+    Raises ValueError when the two runs used different fixtures: their timings are not comparable.
+    """
+    mismatches = fixture_mismatches(current['meta'], baseline)
+    if mismatches:
+        raise ValueError("fixture differs from the baseline: " + ", ".join(mismatches))
+    regressions = []
+    for name, base in baseline.get('timings', {}).items():
+        cur = current['timings'].get(name)
+        if cur is None:
+            continue
+        limit = base['median_ms'] * (1 + tolerance)
+        if cur['median_ms'] > limit and cur['median_ms'] - base['median_ms'] > MIN_REGRESSION_MS:
+            regressions.append(f"{name}: median {cur['median_ms']:.3f}ms vs baseline {base['median_ms']:.3f}ms")
+    for name, base in baseline.get('concurrency', {}).items():
+        cur = current['concurrency'].get(name)
+        if cur is None:
+            continue
+        if cur['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: {cur['ops_per_sec']} ops/s vs baseline {base['ops_per_sec']} ops/s")
+        if cur['errors'] > base['errors']:
+            regressions.append(f"{name}: {cur['errors']} lock errors vs baseline {base['errors']}")
+    for module in current.get('cold_start', {}).get('heavy_modules', []):
+        regressions.append(f"cold start: the login page imported {module}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TradeFlow synthetic-load benchmarks")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--trades", type=int, default=100000)
+    parser.add_argument("--heavy-trades", type=int, default=20000, help="Trades owned by the single heavy user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=50, help="Calls per timed function")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds of concurrent load per mode")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--logins", type=int, default=400, help="Logins in the concurrent auth throughput run")
+    parser.add_argument("--api-clients", type=int, default=8, help="Client processes in the API load test (0 skips it)")
+    parser.add_argument("--cold-starts", type=int, default=5, help="Fresh processes timed to the login page (0 skips it)")
+    parser.add_argument("--shards", type=int, default=4, help="Shards in the sharded write run (1 skips it)")
+    parser.add_argument("--out", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown before flagging, e.g. 0.5 = 50%%")
+    args = parser.parse_args(argv)
+
+    meta = {'users': args.users, 'trades': args.trades, 'heavy_trades': args.heavy_trades, 'seed': args.seed,
+            'bcrypt_rounds': datagen.BCRYPT_ROUNDS}
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # Fail before spending minutes on a run that cannot be compared
+        mismatches = fixture_mismatches(meta, baseline)
+        if mismatches:
+            print(f"Fixture differs from {args.baseline}: {', '.join(mismatches)}. Rerun with the baseline's "
+                  "--users/--trades/--heavy-trades/--seed, or record a new baseline with --save-baseline",
+                  file=sys.stderr)
+            return 2
+
+    workdir = tempfile.mkdtemp(prefix="tradeflow-bench-")
+    db.close_connections()
+    db.DB_PATH = os.path.join(workdir, "tradeflow.db")
+    # Match the fixture's hashes so logins measure verification, not rehash-on-login
+    db.BCRYPT_ROUNDS = datagen.BCRYPT_ROUNDS
+    db.init_db()
+
+    started = time.perf_counter()
+    fixture = datagen.populate(db, args.users, args.trades, args.heavy_trades, seed=args.seed)
+    populate_s = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    results = {
+        'meta': dict(meta, python=platform.python_version(), sqlite=sqlite3.sqlite_version,
+                     machine=platform.machine(), auth_workers=auth.AUTH_WORKERS, populate_s=round(populate_s, 2)),
+        'timings': {},
+        'concurrency': {},
+    }
+    if args.cold_starts:
+        cold = run_cold_start(db.DB_PATH, args.cold_starts)
+        results['timings'].update(cold['timings'])
+        results['cold_start'] = {'heavy_modules': cold['heavy_modules']}
+    results['timings'].update(run_functions(fixture, args.repeat, rng))
+    results['timings'].update(run_pages(fixture, args.repeat))
+    results['concurrency'] = run_concurrency(fixture, args.threads, args.processes, args.duration, args.write_ratio)
+    results['concurrency'][f'auth.logins.{args.threads}'] = run_auth(fixture, args.threads, args.logins)
+    if args.api_clients:
+        results['concurrency'].update(run_api(fixture, args.api_clients, args.duration, args.write_ratio))
+    if args.shards > 1:
+        sharded = run_sharded(args.threads, args.duration, args.shards)
+        results['timings'].update(sharded['timings'])
+        results['concurrency'].update(sharded['concurrency'])
+    db.close_connections()
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(output + "\n")
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if baseline is None:
+        print("No baseline to compare against (run with --save-baseline)", file=sys.stderr)
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    if not regressions:
+        print("No regressions against baseline", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
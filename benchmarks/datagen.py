@@ -0,0 +1,71 @@
+"""Deterministic synthetic ledgers for the TradeFlow benchmarks.
+
+The same seed always produces the same users, trades and ids, so timings from
+different runs (and the stored baseline) are measured against identical data.
+"""
+import datetime
+import random
+import bcrypt
+
+EVENTS = ['BTC', 'ETH', 'SOL', 'XRP', 'ASX', 'NYSE', 'NASDAQ', 'FTSE', 'DAX', 'NIKKEI', 'GOLD', 'OIL', 'EURUSD', 'GBPUSD']
+PASSWORD = "bench-password"
+BCRYPT_ROUNDS = 4      # one cheap hash for everyone: the fixture should not spend minutes in bcrypt
+HEAVY_USER = "heavy_trader"
+BATCH_SIZE = 50000
+
+def _random_trades(rng, user_ids, count, first_day, days):
+    for _ in range(count):
+        day = first_day + rng.randrange(days)
+        spent = rng.randrange(1000, 500000)                    # $10 - $5,000 in cents
+        earned = max(0, int(spent * rng.gauss(1.02, 0.15)))
+        yield (rng.choice(user_ids), day, rng.choice(EVENTS), spent, earned, earned - spent)
+
+def _date_key(ordinal):
+    d = datetime.date.fromordinal(ordinal)
+    return d.year * 10000 + d.month * 100 + d.day
+
+def populate(db, users=10000, trades=100000, heavy_trades=20000, seed=42, years=5):
+    """Fills the (already initialised) database at db.DB_PATH.
+
+    Creates `users` users sharing `trades` trades at random, plus one HEAVY_USER with
+    `heavy_trades` trades of their own. Rows are bulk inserted directly, then the rollups
+    are rebuilt. Returns {'user_ids': [...], 'heavy_user_id': id, 'usernames': [...]}.
+    """
+    rng = random.Random(seed)
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    usernames = [f"user{i:06d}" for i in range(users)]
+    first_day = datetime.date.today().toordinal() - 365 * years
+    days = 365 * years
+
+    with db.get_connection() as conn:
+        c = conn.cursor()
+        c.executemany("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                      ((name, password_hash) for name in usernames + [HEAVY_USER]))
+        conn.commit()
+        c.execute("SELECT id, username FROM users")
+        ids = dict((name, uid) for uid, name in c.fetchall())
+        user_ids = [ids[name] for name in usernames]
+        heavy_user_id = ids[HEAVY_USER]
+
+        def insert(rows):
+            batch = []
+            for uid, day, event, spent, earned, pnl in rows:
+                batch.append((uid, _date_key(day), event, spent, earned, pnl))
+                if len(batch) >= BATCH_SIZE:
+                    c.executemany('''INSERT INTO trades (user_id, date, event, spent_cents, earned_cents, pnl_cents)
+                                     VALUES (?, ?, ?, ?, ?, ?)''', batch)
+                    conn.commit()
+                    batch = []
+            if batch:
+                c.executemany('''INSERT INTO trades (user_id, date, event, spent_cents, earned_cents, pnl_cents)
+                                 VALUES (?, ?, ?, ?, ?, ?)''', batch)
+                conn.commit()
+
+        if user_ids:
+            insert(_random_trades(rng, user_ids, trades, first_day, days))
+        insert(_random_trades(rng, [heavy_user_id], heavy_trades, first_day, days))
+        c.execute("ANALYZE")
+        conn.commit()
+
+    db.rebuild_monthly_rollups()
+    return {'user_ids': user_ids, 'heavy_user_id': heavy_user_id, 'usernames': usernames}
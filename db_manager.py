@@ -1,137 +1,1398 @@
 import sqlite3
-import pandas as pd
 import bcrypt
 import os
+import atexit
+import contextvars
+import datetime
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
+from cache import UserResultCache
+from write_queue import WriteQueue
+from instrumentation import instrument
+import instrumentation
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "tradeflow.db")
 
+# Compact in-memory layout of trade reads (amounts are integer cents, dates YYYYMMDD integers).
+# pandas itself is imported by the functions that build frames, keeping it off the login path.
+TRADE_COLUMNS = "id, date, month, event, spent_cents, earned_cents, pnl_cents"
+TRADE_DTYPES = {
+    'id': 'int64', 'date': 'int32', 'month': 'int32', 'event': 'category',
+    'spent_cents': 'int64', 'earned_cents': 'int64', 'pnl_cents': 'int64',
+}
+
+# Trade History page size
+HISTORY_PAGE_SIZE = 25
+
+# Bulk import
+IMPORT_CHUNK_SIZE = 5000
+IMPORT_MAX_REJECTED = 1000   # rejected rows kept for display; the count is always exact
+IMPORT_COLUMN_ALIASES = {
+    # Common broker export headers -> ledger columns
+    'trade_date': 'date', 'execution_date': 'date', 'timestamp': 'date',
+    'symbol': 'event', 'ticker': 'event', 'market': 'event', 'instrument': 'event',
+    'cost': 'spent', 'amount_spent': 'spent', 'capital': 'spent',
+    'proceeds': 'earned', 'return': 'earned', 'gross_return': 'earned',
+}
+IMPORT_REQUIRED_COLUMNS = ('date', 'event', 'spent', 'earned')
+
+# Largest accepted trade amount in dollars; keeps cents, and per-user sums of them, far inside int64
+MAX_AMOUNT = 10 ** 12
+
+# Ledger export
+EXPORT_CHUNK_SIZE = 10000
+EXPORT_FORMATS = ('csv', 'parquet')
+EXPORT_COLUMNS = ('id', 'date', 'event', 'spent', 'earned', 'pnl')
+
+# Read cache: bounded across all users, LRU eviction
+CACHE_MAX_ENTRIES = int(os.environ.get("TRADEFLOW_CACHE_SIZE", "256"))
+
+# Password hashing cost; existing hashes are upgraded on their next successful login
+BCRYPT_ROUNDS = int(os.environ.get("TRADEFLOW_BCRYPT_ROUNDS", "12"))
+
+# Connection tuning
+POOL_SIZE = int(os.environ.get("TRADEFLOW_POOL_SIZE", "8"))
+BUSY_TIMEOUT_MS = int(os.environ.get("TRADEFLOW_BUSY_TIMEOUT_MS", "5000"))
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",         # readers no longer block the writer
+    "PRAGMA synchronous=NORMAL",       # safe with WAL, avoids an fsync per commit
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA cache_size=-16000",        # ~16MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",          # enforce users -> trades/rollups/tombstones, ON DELETE CASCADE
+)
+
+# Bulk deletes (account deletion, wipe) run in short transactions of at most this many rows,
+# so other sessions' writes are never stuck behind one huge DELETE
+DELETE_CHUNK_SIZE = int(os.environ.get("TRADEFLOW_DELETE_CHUNK_SIZE", "2000"))
+
+# Tombstones older than this are pruned by run_maintenance. Readers synced before a pruned
+# deletion (a session idle that long, a stale snapshot) fall back to a full reload
+TOMBSTONE_RETENTION_S = float(os.environ.get("TRADEFLOW_TOMBSTONE_RETENTION_S", "86400"))
+
+# Write-behind queue: trade inserts/deletes from all sessions are group-committed by one
+# writer thread. A batch is everything queued while the previous commit ran, capped at
+# WRITE_MAX_BATCH; WRITE_MAX_LATENCY_MS > 0 additionally holds a batch open that long for
+# stragglers (bigger batches, slower single writes).
+WRITE_MAX_BATCH = int(os.environ.get("TRADEFLOW_WRITE_MAX_BATCH", "500"))
+WRITE_MAX_LATENCY_MS = float(os.environ.get("TRADEFLOW_WRITE_MAX_LATENCY_MS", "0"))
+
+# Sharding: with TRADEFLOW_SHARDS > 1, users are spread over that many database files, each
+# with its own write lock and writer thread. Shard 0 is DB_PATH itself, so an existing
+# single-file deployment becomes shard 0. A small directory database next to the shards maps
+# username -> (user_id, shard) and allocates user ids, which stay unique across shards.
+# Trade ids are per shard and change when a user is moved (move_user).
+SHARDS = int(os.environ.get("TRADEFLOW_SHARDS", "1"))
+ROUTE_CACHE_S = float(os.environ.get("TRADEFLOW_ROUTE_CACHE_S", "30"))   # how long a process trusts a cached user -> shard
+MOVE_CHUNK_SIZE = 5000          # trades copied per target transaction in move_user
+REBALANCE_TOLERANCE = 0.1       # plan_rebalance stops once shards are within this fraction of the mean load
+
+# Kept here so migrations that rebuild trades can recreate it. No tombstones once the account
+# itself is gone (its delete cascades here and to the tombstones)
+TOMBSTONE_TRIGGER = '''CREATE TRIGGER trades_tombstone_ad AFTER DELETE ON trades
+                       WHEN EXISTS (SELECT 1 FROM users WHERE id = old.user_id) BEGIN
+                           INSERT INTO trade_tombstones (user_id, trade_id) VALUES (old.user_id, old.id);
+                       END'''
+
+class ConnectionPool:
+    """Thread-safe pool of open SQLite connections for a single database file."""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if instrumentation.ENABLED:
+            conn.set_trace_callback(instrumentation.trace_sql)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            # Nested use on the same thread shares the outer connection
+            yield conn
+            return
+
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            # Never hand out a connection with a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                if not self._closed and len(self._idle) < self.size:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(path=None):
+    path = path or current_db()
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    """Borrow a pooled connection to the current database: `with get_connection() as conn: ...`"""
+    return get_pool().connection()
 
-def init_db():
-    conn = get_connection()
+_write_queues = {}
+
+def get_write_queue(path=None):
+    """The process-wide write queue for a database file, started on first use."""
+    path = path or current_db()
+    with _pools_lock:
+        wq = _write_queues.get(path)
+        if wq is None:
+            wq = _write_queues[path] = WriteQueue(lambda: get_pool(path).connection(),
+                                                  WRITE_MAX_BATCH, WRITE_MAX_LATENCY_MS)
+        return wq
+
+def close_connections():
+    """Commits any queued writes, then closes every pooled connection. Safe to call more than once."""
+    with _pools_lock:
+        queues = list(_write_queues.values())
+        _write_queues.clear()
+    for wq in queues:
+        wq.shutdown()
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+atexit.register(close_connections)
+
+def write_queue_stats():
+    """Write queue counters per shard index."""
+    return {shard: get_write_queue(path).stats() for shard, path in enumerate(shard_paths())}
+
+_route = contextvars.ContextVar("tradeflow_route", default=None)
+
+def shard_paths():
+    """The database files holding user data, in shard order (just DB_PATH when unsharded)."""
+    if SHARDS <= 1:
+        return [DB_PATH]
+    base, ext = os.path.splitext(DB_PATH)
+    return [DB_PATH] + [f"{base}.shard{i}{ext}" for i in range(1, SHARDS)]
+
+def directory_path():
+    base, ext = os.path.splitext(DB_PATH)
+    return f"{base}.directory{ext}"
+
+def current_db():
+    """The file get_connection() and get_write_queue() use in this thread or task."""
+    return _route.get() or DB_PATH
+
+@contextmanager
+def using(path):
+    """Points get_connection() and get_write_queue() at `path` for the duration of the block."""
+    token = _route.set(path)
+    try:
+        yield
+    finally:
+        _route.reset(token)
+
+def _directory():
+    return get_pool(directory_path()).connection()
+
+_routes = {}   # (DB_PATH, user_id) -> (shard, expires at)
+
+def shard_of(user_id):
+    """Shard index holding `user_id`; 0 when unsharded or for unknown users."""
+    if SHARDS <= 1:
+        return 0
+    key = (DB_PATH, user_id)
+    entry = _routes.get(key)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+    with _directory() as conn:
+        res = conn.execute("SELECT shard FROM users WHERE id = ?", (user_id,)).fetchone()
+    if res is None:
+        return 0
+    _routes[key] = (res[0], time.monotonic() + ROUTE_CACHE_S)
+    return res[0]
+
+def _forget_route(user_id):
+    _routes.pop((DB_PATH, user_id), None)
+
+def _lookup_username(username):
+    with _directory() as conn:
+        res = conn.execute("SELECT id, shard FROM users WHERE username = ?", (username,)).fetchone()
+    return res if res else (None, None)
+
+def route_path(key):
+    """Shard file for a user, given their user_id (int) or username (str)."""
+    if SHARDS <= 1:
+        return DB_PATH
+    shard = _lookup_username(key)[1] if isinstance(key, str) else shard_of(key)
+    return shard_paths()[shard or 0]
+
+def routed(fn=None, arg=0):
+    """Runs `fn` against the shard of the user in positional argument `arg`.
+
+    The user is a user_id or a username (also accepted as the `user_id=`/`username=` keyword).
+    Generator functions are routed for every step, since their body runs lazily.
+    """
+    if fn is None:
+        return functools.partial(routed, arg=arg)
+
+    def path_for(args, kwargs):
+        return route_path(args[arg] if len(args) > arg else kwargs.get('user_id', kwargs.get('username')))
+
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def gen_wrapper(*args, **kwargs):
+            if SHARDS <= 1:
+                yield from fn(*args, **kwargs)
+                return
+            path = path_for(args, kwargs)
+            steps = fn(*args, **kwargs)
+            while True:
+                with using(path):
+                    try:
+                        item = next(steps)
+                    except StopIteration:
+                        return
+                yield item
+        return gen_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if SHARDS <= 1:
+            return fn(*args, **kwargs)
+        with using(path_for(args, kwargs)):
+            return fn(*args, **kwargs)
+    return wrapper
+
+# Schema migrations, registered in version order with @migration. init_db applies every
+# step above the stored version, each in its own transaction together with the version
+# bump, so an interrupted upgrade resumes at the first step that did not commit.
+MIGRATIONS = []
+
+def migration(version, foreign_keys=True, transaction=True):
+    """Registers `fn(c)` as the step that brings the schema to `version`.
+
+    `foreign_keys=False` runs the step with enforcement off (table rebuilds); `transaction=False`
+    is for statements that cannot run inside one, such as VACUUM, and must be idempotent.
+    """
+    def register(fn):
+        if any(v == version for v, *_ in MIGRATIONS):
+            raise ValueError(f"duplicate migration version {version}")
+        MIGRATIONS.append((version, fn, foreign_keys, transaction))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+def schema_version(c):
+    c.execute("SELECT MAX(version) FROM schema_version")
+    res = c.fetchone()
+    return res[0] if res and res[0] is not None else 0
+
+def migrate(conn):
+    """Applies pending migrations on `conn`. Returns the versions applied."""
     c = conn.cursor()
-    
-    # 1. Versioning Table
     c.execute('''CREATE TABLE IF NOT EXISTS schema_version
                  (version INTEGER PRIMARY KEY)''')
-    
-    # Get current version
-    c.execute("SELECT version FROM schema_version")
-    res = c.fetchone()
-    current_version = res[0] if res else 0
-
-    # 2. Migrations
-    if current_version < 1:
-        # Initial Schema
-        c.execute('''CREATE TABLE IF NOT EXISTS users
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      username TEXT UNIQUE NOT NULL,
-                      password_hash TEXT NOT NULL)''')
-        
-        c.execute('''CREATE TABLE IF NOT EXISTS trades
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      user_id INTEGER NOT NULL,
-                      date TEXT NOT NULL,
-                      event TEXT NOT NULL,
-                      spent REAL NOT NULL,
-                      earned REAL NOT NULL,
-                      pnl REAL NOT NULL,
-                      FOREIGN KEY(user_id) REFERENCES users(id))''')
-        
-        c.execute("INSERT OR REPLACE INTO schema_version (version) VALUES (1)")
+    conn.commit()
+    current_version = schema_version(c)
+    applied = []
+    for version, step, foreign_keys, transaction in MIGRATIONS:
+        if version <= current_version:
+            continue
+        if not foreign_keys:
+            c.execute("PRAGMA foreign_keys=OFF")   # no-op inside a transaction, so before BEGIN
+        try:
+            if transaction:
+                c.execute("BEGIN IMMEDIATE")
+            step(c)
+            c.execute("DELETE FROM schema_version")
+            c.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            if not foreign_keys:
+                c.execute("PRAGMA foreign_keys=ON")
+        applied.append(version)
+    return applied
+
+try:
+    import fcntl
+except ImportError:   # not on Windows; migrations are still transactional, just not serialised up front
+    fcntl = None
+
+_initialised = set()
+_init_lock = threading.Lock()
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive advisory lock across processes, held for the duration of the block."""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _init_once(path, setup):
+    if path in _initialised:
+        return
+    with _init_lock:
+        if path in _initialised:
+            return
+        with _file_lock(path + ".lock"), using(path), get_connection() as conn:
+            setup(conn)
+        _initialised.add(path)
+
+@instrument
+def init_db():
+    """Brings the schema of every shard (and the shard directory) up to date, once per process.
+
+    Later calls (every Streamlit rerun) return immediately. The first call in each process
+    takes a lock file next to each database, so concurrently starting processes run the
+    migrations one at a time and all but the first find nothing left to do.
+    """
+    for path in shard_paths():
+        _init_once(path, migrate)
+    if SHARDS > 1:
+        _init_once(directory_path(), _migrate_directory)
+
+def _migrate_directory(conn):
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  username TEXT UNIQUE NOT NULL,
+                  shard INTEGER NOT NULL)''')
+    c.execute("SELECT 1 FROM users LIMIT 1")
+    if c.fetchone() is None:
+        # First start with sharding on: adopt the accounts already in the shard files
+        # (normally all of them in shard 0, the former single database)
+        c.execute("BEGIN IMMEDIATE")
+        for shard, path in enumerate(shard_paths()):
+            with get_pool(path).connection() as shard_conn:
+                rows = shard_conn.execute("SELECT id, username FROM users").fetchall()
+            c.executemany("INSERT INTO users (id, username, shard) VALUES (?, ?, ?)",
+                          [(user_id, username, shard) for user_id, username in rows])
         conn.commit()
-    
-    # Placeholder for future migrations
-    # if current_version < 2:
-    #     # Example: c.execute("ALTER TABLE trades ADD COLUMN tags TEXT")
-    #     # c.execute("UPDATE schema_version SET version = 2")
-    #     # conn.commit()
 
-    conn.close()
+@migration(1)
+def _initial_schema(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  username TEXT UNIQUE NOT NULL,
+                  password_hash TEXT NOT NULL)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS trades
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER NOT NULL,
+                  date TEXT NOT NULL,
+                  event TEXT NOT NULL,
+                  spent REAL NOT NULL,
+                  earned REAL NOT NULL,
+                  pnl REAL NOT NULL,
+                  FOREIGN KEY(user_id) REFERENCES users(id))''')
+
+@migration(2)
+def _user_counters(c):
+    # Per-user change counter, bumped by every write; cached reads are keyed on it. Session
+    # tokens carry the session generation; bumping it (revoke_sessions) invalidates every
+    # token issued before
+    c.execute("ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0")
+    c.execute("ALTER TABLE users ADD COLUMN session_generation INTEGER NOT NULL DEFAULT 0")
+
+@migration(3, foreign_keys=False)
+def _integer_trades(c):
+    # The one rebuild of trades: amounts in cents (no float drift in sums), dates as YYYYMMDD
+    # integers with a generated YYYYMM month key, so reads need no date parsing, and ON DELETE
+    # CASCADE from users (SQLite can only add foreign keys by rebuilding the table). The type
+    # conversion rides along with the copy the foreign key needs anyway.
+    # Rows left behind by accounts deleted before cascading deletes existed
+    c.execute("DELETE FROM trades WHERE user_id NOT IN (SELECT id FROM users)")
+    _rebuild_table(c, 'trades', '''CREATE TABLE trades_new
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                  date INTEGER NOT NULL,
+                  month INTEGER GENERATED ALWAYS AS (date / 100) VIRTUAL,
+                  event TEXT NOT NULL,
+                  spent_cents INTEGER NOT NULL,
+                  earned_cents INTEGER NOT NULL,
+                  pnl_cents INTEGER NOT NULL)''',
+                   "id, user_id, date, event, spent_cents, earned_cents, pnl_cents",
+                   '''id, user_id, CAST(replace(substr(date, 1, 10), '-', '') AS INTEGER), event,
+                      CAST(round(spent * 100) AS INTEGER), CAST(round(earned * 100) AS INTEGER),
+                      CAST(round(earned * 100) AS INTEGER) - CAST(round(spent * 100) AS INTEGER)''')
+    # Per-user indexes so the dashboard queries stop scanning every user's trades.
+    # (user_id, date, id) serves `ORDER BY date DESC, id DESC` without a sort step;
+    # (user_id, event) covers the DISTINCT event lookup; (user_id, id) finds trades above an
+    # id high-water mark for incremental readers (session sync, columnar snapshots)
+    c.execute("CREATE INDEX idx_trades_user_date ON trades (user_id, date, id)")
+    c.execute("CREATE INDEX idx_trades_user_event ON trades (user_id, event)")
+    c.execute("CREATE INDEX idx_trades_user_id ON trades (user_id, id)")
+
+@migration(4)
+def _monthly_rollups(c):
+    # Pre-aggregated monthly totals for Advanced Analytics, kept in step by add/delete_trade
+    c.execute('''CREATE TABLE monthly_rollups
+                 (user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                  event TEXT NOT NULL,
+                  month INTEGER NOT NULL,
+                  spent_cents INTEGER NOT NULL DEFAULT 0,
+                  earned_cents INTEGER NOT NULL DEFAULT 0,
+                  pnl_cents INTEGER NOT NULL DEFAULT 0,
+                  trade_count INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (user_id, event, month)) WITHOUT ROWID''')
+    _rebuild_rollups(c)
+
+@migration(5)
+def _change_feed(c):
+    # Change feed for incremental readers: new trades are found by id high-water mark through
+    # idx_trades_user_id, deletions through these tombstones. Pruning raises the user's
+    # tombstone_horizon to the last seq it removed; readers synced below it start over
+    c.execute('''CREATE TABLE trade_tombstones
+                 (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                  trade_id INTEGER NOT NULL,
+                  deleted_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)))''')
+    c.execute("CREATE INDEX idx_tombstones_user_seq ON trade_tombstones (user_id, seq)")
+    c.execute(TOMBSTONE_TRIGGER)
+    c.execute("ALTER TABLE users ADD COLUMN tombstone_horizon INTEGER NOT NULL DEFAULT 0")
+
+@migration(6, transaction=False)
+def _incremental_vacuum(c):
+    # Incremental auto-vacuum so space freed by deletions can be handed back to the OS by
+    # run_maintenance without a full VACUUM. Only takes effect after one full VACUUM, which
+    # also returns the pages of the pre-v3 trades table: a one-off cost at upgrade time
+    c.execute("PRAGMA auto_vacuum")
+    if c.fetchone()[0] != 2:
+        c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        c.execute("VACUUM")
+
+def _rebuild_table(c, table, create_sql, columns, select=None):
+    """Swaps `table` for the `<table>_new` defined by `create_sql`, keeping its rows and AUTOINCREMENT state.
+
+    `select` converts old rows into `columns` (default: copied as they are). Indexes and
+    triggers on the old table are dropped with it; the caller recreates them.
+    """
+    c.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+    res = c.fetchone()
+    c.execute(create_sql)
+    c.execute(f"INSERT INTO {table}_new ({columns}) SELECT {select or columns} FROM {table}")
+    c.execute(f"DROP TABLE {table}")
+    c.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    if res:
+        # Never reuse ids of rows deleted before the rebuild
+        c.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = ?", (table,))
+        seq = max(res[0], c.fetchone()[0])
+        c.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+        c.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, seq))
+
+def date_key(value):
+    """date, datetime or ISO string -> the YYYYMMDD integer stored in trades.date."""
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value[:10])
+    return value.year * 10000 + value.month * 100 + value.day
+
+def key_to_date(key):
+    return datetime.date(key // 10000, key // 100 % 100, key % 100)
+
+def to_cents(amount):
+    return int(Decimal(str(amount)).scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
 
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+
+def hash_rounds(hashed):
+    """Work factor a bcrypt hash was created with ($2b$<rounds>$...), or None if unreadable."""
+    try:
+        return int(hashed.split(b'$')[2])
+    except (IndexError, ValueError):
+        return None
 
 def check_password(password, hashed):
     return bcrypt.checkpw(password.encode('utf-8'), hashed)
 
+@instrument
 def create_user(username, password):
-    conn = get_connection()
-    c = conn.cursor()
     hashed = hash_password(password)
-    try:
-        c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, hashed))
+    if SHARDS > 1:
+        return _create_sharded_user(username, hashed)
+    with get_connection() as conn:
+        c = conn.cursor()
+        try:
+            c.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", (username, hashed))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+def _create_sharded_user(username, hashed):
+    # The directory allocates the id and holds its transaction open until the shard has
+    # the account, so a failure on either side leaves neither
+    with _directory() as conn:
+        c = conn.cursor()
+        try:
+            c.execute("INSERT INTO users (username, shard) VALUES (?, 0)", (username,))
+        except sqlite3.IntegrityError:
+            return False
+        user_id = c.lastrowid
+        shard = user_id % SHARDS
+        c.execute("UPDATE users SET shard = ? WHERE id = ?", (shard, user_id))
+        with using(shard_paths()[shard]), get_connection() as shard_conn:
+            try:
+                shard_conn.execute("INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)",
+                                   (user_id, username, hashed))
+            except sqlite3.IntegrityError:
+                return False
+            shard_conn.commit()
         conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    return True
 
+@instrument
+@routed
 def authenticate_user(username, password):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT id, password_hash FROM users WHERE username = ?", (username,))
-    data = c.fetchone()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, password_hash FROM users WHERE username = ?", (username,))
+        data = c.fetchone()
     if data:
         user_id, stored_hash = data
+        if isinstance(stored_hash, str):
+            stored_hash = stored_hash.encode('utf-8')
         if check_password(password, stored_hash):
+            if hash_rounds(stored_hash) != BCRYPT_ROUNDS:
+                # Work factor changed since this hash was made: upgrade it while we have the password
+                with get_connection() as conn:
+                    conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (hash_password(password), user_id))
+                    conn.commit()
             return user_id, username
     return None, None
 
+_result_cache = UserResultCache(CACHE_MAX_ENTRIES)
+
+@instrument
+@routed
+def get_data_version(user_id):
+    """Current change counter for a user's trades (None once the user no longer exists)."""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT data_version FROM users WHERE id = ?", (user_id,))
+        res = c.fetchone()
+    return res[0] if res else None
+
+@routed
+def get_session_generation(user_id):
+    """(username, session_generation) of an account, or None once it no longer exists. Never cached."""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT username, session_generation FROM users WHERE id = ?", (user_id,))
+        return c.fetchone()
+
+def _revoke_sessions(c, user_id):
+    c.execute("UPDATE users SET session_generation = session_generation + 1 WHERE id = ?", (user_id,))
+
+@instrument
+@routed
+def revoke_sessions(user_id):
+    """Invalidates every session token issued to the user so far (logout)."""
+    get_write_queue().submit(_revoke_sessions, user_id).result()
+
+def _bump_data_version(c, user_id=None):
+    if user_id is None:
+        c.execute("UPDATE users SET data_version = data_version + 1")
+    else:
+        c.execute("UPDATE users SET data_version = data_version + 1 WHERE id = ?", (user_id,))
+
+def cached_read(fn):
+    """Caches a `fn(user_id, ...)` read until that user's data version changes.
+
+    Cached results are shared between sessions, so callers must treat them as read-only.
+    """
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(user_id, *args, **kwargs):
+        # Keyed on the bound arguments, so f(u), f(u, None) and f(u, event=None) share an entry
+        bound = signature.bind(user_id, *args, **kwargs)
+        bound.apply_defaults()
+        key = (fn.__name__, user_id, bound.args[1:], tuple(sorted(bound.kwargs.items())), DB_PATH)
+        version = get_data_version(user_id)
+        found, result = _result_cache.get(key, version)
+        if not found:
+            result = fn(user_id, *args, **kwargs)
+            _result_cache.put(key, version, result)
+        return result
+    wrapper.uncached = fn
+    return wrapper
+
+def cache_stats():
+    """Hit/miss/eviction counters for the per-user read cache."""
+    return _result_cache.stats()
+
+ROLLUP_UPSERT = '''INSERT INTO monthly_rollups
+                       (user_id, event, month, spent_cents, earned_cents, pnl_cents, trade_count)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (user_id, event, month) DO UPDATE SET
+                       spent_cents = spent_cents + excluded.spent_cents,
+                       earned_cents = earned_cents + excluded.earned_cents,
+                       pnl_cents = pnl_cents + excluded.pnl_cents,
+                       trade_count = trade_count + excluded.trade_count'''
+
+def _apply_rollup(c, user_id, date, event, spent_cents, earned_cents, pnl_cents, count):
+    """Adds one trade's amounts (or removes them, with negative values) to its monthly rollup row."""
+    month = date // 100
+    c.execute(ROLLUP_UPSERT, (user_id, event, month, spent_cents, earned_cents, pnl_cents, count))
+    if count < 0:
+        c.execute("DELETE FROM monthly_rollups WHERE user_id = ? AND event = ? AND month = ? AND trade_count <= 0",
+                  (user_id, event, month))
+
+def _rebuild_rollups(c, user_id=None):
+    where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    c.execute(f"DELETE FROM monthly_rollups {where}", params)
+    c.execute(f'''INSERT INTO monthly_rollups
+                      (user_id, event, month, spent_cents, earned_cents, pnl_cents, trade_count)
+                  SELECT user_id, event, month, SUM(spent_cents), SUM(earned_cents), SUM(pnl_cents), COUNT(*)
+                  FROM trades {where}
+                  GROUP BY user_id, event, month''', params)
+    return c.rowcount
+
+@instrument
+def rebuild_monthly_rollups(user_id=None):
+    """Recomputes monthly_rollups from trades, for one user or everyone. Returns rows written."""
+    count = 0
+    for path in shard_paths() if user_id is None else [route_path(user_id)]:
+        with using(path), get_connection() as conn:
+            c = conn.cursor()
+            count += _rebuild_rollups(c, user_id)
+            _bump_data_version(c, user_id)
+            conn.commit()
+    return count
+
+@instrument
+def get_user_id(username):
+    if SHARDS > 1:
+        return _lookup_username(username)[0]
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id FROM users WHERE username = ?", (username,))
+        res = c.fetchone()
+    return res[0] if res else None
+
+def _insert_trade(c, user_id, day, event, spent_cents, earned_cents):
+    pnl_cents = earned_cents - spent_cents
+    c.execute('''INSERT INTO trades (user_id, date, event, spent_cents, earned_cents, pnl_cents)
+                 VALUES (?, ?, ?, ?, ?, ?)''',
+              (user_id, day, event, spent_cents, earned_cents, pnl_cents))
+    _apply_rollup(c, user_id, day, event, spent_cents, earned_cents, pnl_cents, 1)
+    _bump_data_version(c, user_id)
+    return c.lastrowid
+
+@instrument
+@routed
+def submit_trade(user_id, date, event, spent, earned):
+    """Queues one trade for the next group commit. Returns a Future resolving to the new trade id."""
+    return get_write_queue().submit(_insert_trade, user_id, date_key(date), event, to_cents(spent), to_cents(earned))
+
+def _insert_trades(c, user_id, rows):
+    return [_insert_trade(c, user_id, *row) for row in rows]
+
+@instrument
+@routed
+def submit_trades(user_id, trades):
+    """Queues (date, event, spent, earned) trades as one all-or-nothing write. Returns a Future of their ids."""
+    rows = [(date_key(date), event, to_cents(spent), to_cents(earned)) for date, event, spent, earned in trades]
+    return get_write_queue().submit(_insert_trades, user_id, rows)
+
+@instrument
 def add_trade(user_id, date, event, spent, earned):
-    conn = get_connection()
-    c = conn.cursor()
-    pnl = earned - spent
-    c.execute("INSERT INTO trades (user_id, date, event, spent, earned, pnl) VALUES (?, ?, ?, ?, ?, ?)",
-              (user_id, str(date), event, spent, earned, pnl))
-    conn.commit()
-    conn.close()
+    """Records one trade and waits until it is committed. `spent`/`earned` are dollars, stored as cents."""
+    return submit_trade(user_id, date, event, spent, earned).result()
+
+def _normalise_import_chunk(chunk):
+    """Validates one raw CSV chunk. Returns (clean rows, rejected rows with a `reason` column)."""
+    import pandas as pd
+    clean = pd.DataFrame(index=chunk.index)
+    # ISO dates take the fast path; anything else (e.g. 03/14/2024 broker exports) is parsed per element
+    dates = pd.to_datetime(chunk['date'], errors='coerce', format='ISO8601')
+    retry = dates.isna() & chunk['date'].notna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(chunk.loc[retry, 'date'], errors='coerce', format='mixed')
+    clean['date'] = dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day
+    clean['event'] = chunk['event'].fillna('').str.strip().str.upper()
+    clean['spent'] = pd.to_numeric(chunk['spent'], errors='coerce')
+    clean['earned'] = pd.to_numeric(chunk['earned'], errors='coerce')
+
+    reason = pd.Series('', index=chunk.index)
+    reason = reason.mask(clean['date'].isna(), 'invalid date')
+    reason = reason.mask((reason == '') & (clean['event'] == ''), 'missing event')
+    reason = reason.mask((reason == '') & clean['spent'].isna(), 'invalid spent')
+    reason = reason.mask((reason == '') & clean['earned'].isna(), 'invalid earned')
+    reason = reason.mask((reason == '') & ((clean['spent'] < 0) | (clean['earned'] < 0)), 'negative amount')
+    # inf and overflowing values parse as numbers but cannot be stored as cents
+    reason = reason.mask((reason == '') & ((clean['spent'] > MAX_AMOUNT) | (clean['earned'] > MAX_AMOUNT)),
+                         'amount out of range')
+
+    bad = reason != ''
+    rejected = chunk[bad].assign(reason=reason[bad])
+    clean = clean[~bad]
+    # Cents from the original text through to_cents, so imports round exactly like add_trade
+    clean = pd.DataFrame({
+        'date': clean['date'].astype('int64'),
+        'event': clean['event'],
+        'spent_cents': chunk.loc[~bad, 'spent'].map(to_cents).astype('int64'),
+        'earned_cents': chunk.loc[~bad, 'earned'].map(to_cents).astype('int64'),
+    })
+    clean['pnl_cents'] = clean['earned_cents'] - clean['spent_cents']
+    return clean, rejected
+
+def _import_chunk(c, user_id, rows, rollups):
+    c.executemany('''INSERT INTO trades (user_id, date, event, spent_cents, earned_cents, pnl_cents)
+                     VALUES (?, ?, ?, ?, ?, ?)''', ((user_id, *row) for row in rows))
+    c.executemany(ROLLUP_UPSERT, ((user_id, *row) for row in rollups))
+    _bump_data_version(c, user_id)
+
+@instrument
+@routed
+def import_trades_csv(user_id, source, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """Streams trades from a CSV file (path or file object) into a user's ledger.
+
+    Needs date, event, spent and earned columns (common broker header names are mapped).
+    Every chunk is validated and written with executemany as one write-queue operation, and
+    `progress(rows_read)` is called after each one. Returns a dict with `inserted`,
+    `rejected` and `rejected_rows` (the first IMPORT_MAX_REJECTED bad rows plus a `reason`).
+    """
+    import pandas as pd
+    reader = pd.read_csv(source, chunksize=chunk_size, dtype=str, skipinitialspace=True)
+    inserted = rejected = rows_read = 0
+    rejected_frames = []
+
+    for chunk in reader:
+        chunk.columns = [IMPORT_COLUMN_ALIASES.get(col, col)
+                         for col in chunk.columns.str.strip().str.lower().str.replace(' ', '_')]
+        missing = [col for col in IMPORT_REQUIRED_COLUMNS if col not in chunk.columns]
+        if missing:
+            raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+
+        # Report rejects with their line number in the file (header is line 1)
+        chunk.index = pd.RangeIndex(rows_read + 2, rows_read + 2 + len(chunk), name='line')
+        rows_read += len(chunk)
+
+        clean, bad = _normalise_import_chunk(chunk)
+        rejected += len(bad)
+        kept = sum(len(f) for f in rejected_frames)
+        if len(bad) and kept < IMPORT_MAX_REJECTED:
+            rejected_frames.append(bad.iloc[:IMPORT_MAX_REJECTED - kept])
+
+        if not clean.empty:
+            monthly = (clean.assign(month=clean['date'] // 100)
+                       .groupby(['event', 'month'], sort=False)
+                       .agg(spent_cents=('spent_cents', 'sum'), earned_cents=('earned_cents', 'sum'),
+                            pnl_cents=('pnl_cents', 'sum'), trade_count=('pnl_cents', 'size'))
+                       .reset_index())
+            rows = list(clean.itertuples(index=False, name=None))
+            rollups = list(monthly.itertuples(index=False, name=None))
+            # Waiting on each chunk keeps the reader from running ahead of the writer
+            get_write_queue().submit(_import_chunk, user_id, rows, rollups).result()
+            inserted += len(clean)
 
+        if progress:
+            progress(rows_read)
+
+    rejected_rows = pd.concat(rejected_frames) if rejected_frames else pd.DataFrame(columns=['reason'])
+    return {'inserted': inserted, 'rejected': rejected, 'rejected_rows': rejected_rows}
+
+def _read_trades(query, params):
+    import pandas as pd
+    with get_connection() as conn:
+        return pd.read_sql_query(query, conn, params=params).astype(TRADE_DTYPES)
+
+@instrument
+@cached_read
+@routed
 def get_user_trades(user_id):
-    conn = get_connection()
-    query = "SELECT id, date, event, spent, earned, pnl FROM trades WHERE user_id = ? ORDER BY date DESC"
-    df = pd.read_sql_query(query, conn, params=(user_id,))
-    conn.close()
-    return df
+    """All of a user's trades, newest first, in the compact TRADE_DTYPES layout."""
+    query = f"SELECT {TRADE_COLUMNS} FROM trades WHERE user_id = ? ORDER BY date DESC, id DESC"
+    return _read_trades(query, (user_id,))
 
-def delete_trade(trade_id, user_id):
-    conn = get_connection()
-    c = conn.cursor()
+def _keyset_page(query, params, cursor, page_size):
+    if cursor is not None:
+        # Keyset seek: continue strictly after the last row shown, straight off idx_trades_user_date
+        query += " AND (date, id) < (?, ?)"
+        params.extend(cursor)
+    query += " ORDER BY date DESC, id DESC LIMIT ?"
+    params.append(page_size + 1)
+
+    df = _read_trades(query, params)
+
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last = df.iloc[-1]
+        next_cursor = (int(last['date']), int(last['id']))
+    return df, next_cursor
+
+TOMBSTONE_SEQ = '''SELECT COALESCE(MAX(seq), (SELECT tombstone_horizon FROM users WHERE id = ?), 0)
+                   FROM trade_tombstones WHERE user_id = ?'''   # the user's last deletion, pruned or not
+
+def _sync_point(c, user_id):
+    c.execute(f'''SELECT (SELECT COALESCE(MAX(id), 0) FROM trades WHERE user_id = ?),
+                         ({TOMBSTONE_SEQ}),
+                         (SELECT data_version FROM users WHERE id = ?)''', (user_id, user_id, user_id, user_id))
+    return c.fetchone()
+
+def _merge_trades(trades, new, deleted_ids):
+    """Applies a delta to a newest-first trades frame, returning a new frame."""
+    import pandas as pd
+    if deleted_ids:
+        trades = trades[~trades['id'].isin(deleted_ids)].reset_index(drop=True)
+    if new.empty:
+        return trades
+    new = new.sort_values(['date', 'id'], ascending=False)
+    # Both halves need the same categories or concat falls back to object dtype; appending
+    # categories keeps the existing codes, so the big frame is not recoded
+    missing = new['event'].cat.categories.difference(trades['event'].cat.categories)
+    if len(missing):
+        trades = trades.assign(event=trades['event'].cat.add_categories(missing))
+    merged = pd.concat([new.astype({'event': trades['event'].dtype}), trades], ignore_index=True)
+    if not trades.empty and (new['date'].iloc[-1], new['id'].iloc[-1]) < (trades['date'].iloc[0], trades['id'].iloc[0]):
+        # Back-dated entries: restore the date DESC, id DESC order
+        merged = merged.sort_values(['date', 'id'], ascending=False, ignore_index=True)
+    return merged
+
+@instrument
+@routed
+def sync_user_trades(user_id, synced=None):
+    """Keeps a caller-held copy of a user's trades current, fetching only what changed.
+
+    `synced` is the dict returned by the previous call, or None. The result holds the 'trades'
+    frame (get_user_trades layout) plus the sync point it reflects: the highest trade id, the
+    last tombstone seen and the user's data version. An unchanged user costs one lookup; after
+    writes, only rows inserted or deleted since the sync point are read (everything, if
+    tombstones it has not seen were pruned since). The frame is always replaced, never
+    modified in place.
+    """
+    delta = synced is not None and (synced['user_id'], synced['db']) == (user_id, current_db())
+    if delta and synced['version'] == get_data_version(user_id):
+        return synced
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("BEGIN")   # rows and sync point from one consistent read
+        try:
+            if delta:
+                c.execute("SELECT tombstone_horizon FROM users WHERE id = ?", (user_id,))
+                row = c.fetchone()
+                delta = row is not None and row[0] <= synced['tomb_seq']
+            if delta:
+                # Ordered by id so the planner walks idx_trades_user_id from the high-water mark
+                # instead of the user's whole date index; the few new rows are sorted afterwards
+                new = _read_trades(f"SELECT {TRADE_COLUMNS} FROM trades WHERE user_id = ? AND id > ? ORDER BY id",
+                                   (user_id, synced['max_id']))
+                c.execute("SELECT trade_id FROM trade_tombstones WHERE user_id = ? AND seq > ?",
+                          (user_id, synced['tomb_seq']))
+                deleted = [row[0] for row in c.fetchall()]
+            else:
+                trades = _read_trades(f"SELECT {TRADE_COLUMNS} FROM trades WHERE user_id = ? ORDER BY date DESC, id DESC",
+                                      (user_id,))
+            max_id, tomb_seq, version = _sync_point(c, user_id)
+        finally:
+            conn.rollback()
+    if delta:
+        trades = _merge_trades(synced['trades'], new, deleted)
+    return {'user_id': user_id, 'db': current_db(), 'trades': trades,
+            'max_id': max_id, 'tomb_seq': tomb_seq, 'version': version}
+
+@instrument
+@cached_read
+@routed
+def get_trades_page(user_id, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    """One page of a user's trades, newest first.
+
+    `cursor` is the (date, id) of the last row on the previous page (None for the first page).
+    Returns the page DataFrame and the cursor for the next page, or None when this is the last one.
+    """
+    query = f"SELECT {TRADE_COLUMNS} FROM trades WHERE user_id = ?"
+    return _keyset_page(query, [user_id], cursor, page_size)
+
+@instrument
+@cached_read
+@routed
+def search_trades(user_id, query, limit=HISTORY_PAGE_SIZE, cursor=None):
+    """Trades whose event contains `query` (case-insensitive), newest first, paged like get_trades_page.
+
+    Matching events come from the user's monthly_rollups rows, which hold each (event, month)
+    they traded once, so the substring test never touches trades and the cost follows this
+    user's matches however many other accounts share the database.
+    """
+    sql = f'''SELECT {TRADE_COLUMNS} FROM trades
+              WHERE user_id = ? AND event IN (SELECT DISTINCT event FROM monthly_rollups
+                                              WHERE user_id = ? AND instr(lower(event), ?) > 0)'''
+    return _keyset_page(sql, [user_id, user_id, query.strip().lower()], cursor, limit)
+
+def _trade_filter(user_id, event=None, start=None, end=None):
+    """WHERE clause and parameters selecting a user's trades, optionally one event and an inclusive date range."""
+    where, params = "user_id = ?", [user_id]
+    if start is not None:
+        where += " AND date >= ?"
+        params.append(date_key(start))
+    if end is not None:
+        where += " AND date <= ?"
+        params.append(date_key(end))
+    if event is not None:
+        where += " AND event = ?"
+        params.append(event)
+    return where, params
+
+@routed
+def iter_user_trades(user_id, start=None, end=None, event=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields a user's trades oldest first, as DataFrames of at most `chunk_size` rows.
+
+    `start`/`end` bound the trade date (inclusive). Each chunk is its own short keyset query,
+    so no connection or read transaction is held while the caller processes a chunk.
+    """
+    where, params = _trade_filter(user_id, event, start, end)
+    query = f"SELECT {TRADE_COLUMNS} FROM trades WHERE {where}"
+
+    cursor = None
+    while True:
+        page_query, page_params = query, list(params)
+        if cursor is not None:
+            page_query += " AND (date, id) > (?, ?)"
+            page_params.extend(cursor)
+        page_query += " ORDER BY date ASC, id ASC LIMIT ?"
+        page_params.append(chunk_size)
+
+        chunk = _read_trades(page_query, page_params)
+        if chunk.empty:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk.iloc[-1]
+        cursor = (int(last['date']), int(last['id']))
+
+def _ledger_view(chunk):
+    import pandas as pd
+    return pd.DataFrame({
+        'id': chunk['id'],
+        'date': pd.to_datetime(chunk['date'].astype(str), format='%Y%m%d').dt.strftime('%Y-%m-%d'),
+        'event': chunk['event'].astype(str),
+        'spent': chunk['spent_cents'] / 100,
+        'earned': chunk['earned_cents'] / 100,
+        'pnl': chunk['pnl_cents'] / 100,
+    })
+
+@instrument
+def export_trades(user_id, dest, fmt='csv', start=None, end=None, event=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Writes a user's trades to `dest` (a path or binary file object) as CSV or Parquet.
+
+    Rows are streamed chunk by chunk, so memory stays bounded by `chunk_size` however long the
+    ledger is. Parquet output needs the optional pyarrow package. Returns the number of rows written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    import snapshot
+    # Large ledgers can be read from the columnar snapshot instead of SQLite when it is enabled
+    source = snapshot.iter_trades if snapshot.ENABLED else iter_user_trades
+    # Exported ledgers use ISO dates and dollar amounts, the same shape import_trades_csv reads
+    chunks = (_ledger_view(chunk) for chunk in source(user_id, start, end, event, chunk_size))
+    rows = 0
+
+    if fmt == 'csv':
+        out = open(dest, 'wb') if isinstance(dest, (str, os.PathLike)) else dest
+        try:
+            header = True
+            for chunk in chunks:
+                out.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+                header = False
+                rows += len(chunk)
+            if header:
+                out.write((",".join(EXPORT_COLUMNS) + "\n").encode('utf-8'))
+        finally:
+            if out is not dest:
+                out.close()
+        return rows
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs the pyarrow package (pip install pyarrow)")
+
+    schema = pa.schema([('id', pa.int64()), ('date', pa.string()), ('event', pa.string()),
+                        ('spent', pa.float64()), ('earned', pa.float64()), ('pnl', pa.float64())])
+    with pq.ParquetWriter(dest, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+    return rows
+
+def _delete_trade(c, trade_id, user_id):
     # Ensure user owns the trade - critical for isolation
+    c.execute("SELECT date, event, spent_cents, earned_cents, pnl_cents FROM trades WHERE id = ? AND user_id = ?",
+              (trade_id, user_id))
+    row = c.fetchone()
+    if row is None:
+        return False
+    day, event, spent_cents, earned_cents, pnl_cents = row
     c.execute("DELETE FROM trades WHERE id = ? AND user_id = ?", (trade_id, user_id))
-    conn.commit()
-    conn.close()
+    _apply_rollup(c, user_id, day, event, -spent_cents, -earned_cents, -pnl_cents, -1)
+    _bump_data_version(c, user_id)
+    return True
+
+@instrument
+@routed(arg=1)
+def submit_delete(trade_id, user_id):
+    """Queues a trade deletion. Returns a Future resolving to whether the trade existed."""
+    return get_write_queue().submit(_delete_trade, trade_id, user_id)
 
+@instrument
+def delete_trade(trade_id, user_id):
+    return submit_delete(trade_id, user_id).result()
+
+@instrument
+@cached_read
+@routed
 def get_unique_events(user_id):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT DISTINCT event FROM trades WHERE user_id = ? ORDER BY event ASC", (user_id,))
-    events = [row[0] for row in c.fetchall()]
-    conn.close()
-    return events
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT DISTINCT event FROM trades WHERE user_id = ? ORDER BY event ASC", (user_id,))
+        return [row[0] for row in c.fetchall()]
+
+@instrument
+@cached_read
+@routed
+def get_monthly_rollups(user_id, event=None):
+    """Monthly totals (YYYYMM month, cents, trade_count) for a user, optionally one event, oldest first."""
+    import pandas as pd
+    query = '''SELECT month, SUM(spent_cents) AS spent_cents, SUM(earned_cents) AS earned_cents,
+                      SUM(pnl_cents) AS pnl_cents, SUM(trade_count) AS trade_count
+               FROM monthly_rollups WHERE user_id = ?'''
+    params = [user_id]
+    if event is not None:
+        query += " AND event = ?"
+        params.append(event)
+    query += " GROUP BY month ORDER BY month ASC"
+    with get_connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+    return df.astype({'month': 'int32', 'spent_cents': 'int64', 'earned_cents': 'int64',
+                      'pnl_cents': 'int64', 'trade_count': 'int64'})
+
+# Summary columns shared by get_trade_totals and get_trade_breakdown (amounts in cents)
+TRADE_AGGREGATES = '''COUNT(*) AS trades, COALESCE(SUM(spent_cents), 0) AS spent_cents,
+                        COALESCE(SUM(earned_cents), 0) AS earned_cents, COALESCE(SUM(pnl_cents), 0) AS pnl_cents,
+                        COALESCE(SUM(pnl_cents > 0), 0) AS wins,
+                        COALESCE(SUM(MAX(pnl_cents, 0)), 0) AS gross_profit_cents,
+                        COALESCE(-SUM(MIN(pnl_cents, 0)), 0) AS gross_loss_cents,
+                        MIN(date) AS first_date, MAX(date) AS last_date'''
+
+# get_trade_breakdown groupings: name -> SQL key expression
+BREAKDOWN_KEYS = {'event': 'event', 'day': 'date', 'month': 'month', 'year': 'date / 10000'}
+
+@instrument
+@cached_read
+@routed
+def get_trade_totals(user_id, event=None, start=None, end=None):
+    """Trade count and summed amounts (cents) for a user, optionally one event and an inclusive date range.
+
+    Returns a dict of TRADE_AGGREGATES; first_date/last_date are YYYYMMDD keys, or None without trades.
+    """
+    where, params = _trade_filter(user_id, event, start, end)
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT {TRADE_AGGREGATES} FROM trades WHERE {where}", params)
+        return dict(zip([col[0] for col in c.description], c.fetchone()))
+
+@instrument
+@cached_read
+@routed
+def get_trade_breakdown(user_id, by, event=None, start=None, end=None):
+    """TRADE_AGGREGATES per event, day, month (YYYYMM) or year, ordered by that key.
+
+    Only the summary rows leave SQLite (or the columnar snapshot, when enabled); takes the same
+    filters as get_trade_totals.
+    """
+    import pandas as pd
+    import snapshot
+    if by not in BREAKDOWN_KEYS:
+        raise ValueError(f"Unknown breakdown '{by}'; expected one of {', '.join(BREAKDOWN_KEYS)}")
+    if snapshot.ENABLED:
+        return snapshot.trade_breakdown(user_id, by, event, start, end)
+    where, params = _trade_filter(user_id, event, start, end)
+    query = f'''SELECT {BREAKDOWN_KEYS[by]} AS {by}, {TRADE_AGGREGATES}
+                FROM trades WHERE {where} GROUP BY 1 ORDER BY 1'''
+    with get_connection() as conn:
+        return pd.read_sql_query(query, conn, params=params)
+
+@instrument
+@cached_read
+@routed
+def get_pnl_series(user_id, event=None, start=None, end=None):
+    """date, spent_cents and pnl_cents of a user's trades in trade order, for order-dependent metrics.
+
+    Drawdown, streaks and rolling ROI need the sequence rather than a total; this reads just
+    those three columns in idx_trades_user_date order, or from the columnar snapshot when it is
+    enabled. Takes the same filters as get_trade_totals.
+    """
+    import numpy as np
+    import pandas as pd
+    import snapshot
+    if snapshot.ENABLED:
+        return snapshot.pnl_series(user_id, event, start, end)
+    where, params = _trade_filter(user_id, event, start, end)
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT date, spent_cents, pnl_cents FROM trades WHERE {where} ORDER BY date, id", params)
+        rows = np.array(c.fetchall(), dtype='int64').reshape(-1, 3)
+    return pd.DataFrame({'date': rows[:, 0].astype('int32'), 'spent_cents': rows[:, 1], 'pnl_cents': rows[:, 2]})
+
+def _delete_range(c, table, key, cond, params, low, chunk_size):
+    # One chunk: rows with key in (low, high], where high bounds the next `chunk_size` rows
+    started = time.perf_counter()
+    c.execute(f"SELECT {key} FROM {table} WHERE {key} > ?{cond} ORDER BY {key} LIMIT 1 OFFSET ?",
+              (low, *params, chunk_size - 1))
+    row = c.fetchone()
+    if row is None:
+        c.execute(f"DELETE FROM {table} WHERE {key} > ?{cond}", (low, *params))
+    else:
+        c.execute(f"DELETE FROM {table} WHERE {key} > ? AND {key} <= ?{cond}", (low, row[0], *params))
+    return c.rowcount, row[0] if row else None, (time.perf_counter() - started) * 1000
+
+def _delete_chunked(table, key, where=None, params=(), chunk_size=None):
+    """Deletes matching rows in ascending `key` ranges, one short write per chunk.
 
+    Chunks go through the write queue one at a time, so trades submitted by other sessions
+    commit in between instead of waiting for the whole delete. `key` must be a positive
+    integer column led by an index usable with `where`.
+    Returns (rows deleted, longest time one chunk held the write lock, in ms).
+    """
+    chunk_size = chunk_size or DELETE_CHUNK_SIZE
+    cond = f" AND {where}" if where else ""
+    deleted, max_hold_ms, low = 0, 0.0, 0
+    while low is not None:
+        count, low, hold_ms = get_write_queue().submit(_delete_range, table, key, cond, params, low, chunk_size).result()
+        deleted += count
+        max_hold_ms = max(max_hold_ms, hold_ms)
+    return deleted, max_hold_ms
+
+def _raise_tombstone_horizons(c, cutoff):
+    # Tombstones are written in seq order, so the expired ones are a prefix of the table
+    c.execute("SELECT seq FROM trade_tombstones WHERE deleted_at >= ? ORDER BY seq LIMIT 1", (cutoff,))
+    row = c.fetchone()
+    if row is None:
+        c.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM trade_tombstones")
+        row = c.fetchone()
+    c.execute('''UPDATE users SET tombstone_horizon = pruned.seq
+                 FROM (SELECT user_id, MAX(seq) AS seq FROM trade_tombstones
+                       WHERE seq < ? GROUP BY user_id) AS pruned
+                 WHERE users.id = pruned.user_id''', (row[0],))
+    return row[0]
+
+def prune_tombstones(retention_s=None):
+    """Deletes tombstones older than `retention_s` (default TOMBSTONE_RETENTION_S) from the current shard.
+
+    Each affected user's tombstone_horizon is raised before any row goes, so incremental readers
+    that have not seen them reload in full instead of missing deletions.
+    Returns (tombstones deleted, longest time one chunk held the write lock, in ms).
+    """
+    retention_s = TOMBSTONE_RETENTION_S if retention_s is None else retention_s
+    started = time.perf_counter()
+    limit = get_write_queue().submit(_raise_tombstone_horizons, int(time.time() - retention_s)).result()
+    hold_ms = (time.perf_counter() - started) * 1000
+    deleted, max_hold_ms = _delete_chunked('trade_tombstones', 'seq', "seq < ?", (limit,))
+    return deleted, max(hold_ms, max_hold_ms)
+
+def _delete_user_row(c, user_id):
+    started = time.perf_counter()
+    c.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    return (time.perf_counter() - started) * 1000
+
+@instrument
 def wipe_system():
-    """Wipes all data from the system. Use with caution."""
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM trades")
-    c.execute("DELETE FROM users")
-    conn.commit()
-    conn.close()
+    """Wipes all data from the system. Use with caution.
+
+    Runs as a series of short chunked deletes on every shard; returns {'trades', 'users', 'max_lock_ms'}.
+    """
+    result = {'trades': 0, 'users': 0, 'max_lock_ms': 0.0}
+    for path in shard_paths():
+        with using(path):
+            get_write_queue().flush()   # nothing queued may land after the wipe
+            # Trades first: their delete trigger writes tombstones, which are cleared next
+            trades, hold_trades = _delete_chunked('trades', 'id')
+            _, hold_tombstones = _delete_chunked('trade_tombstones', 'seq')
+            _, hold_rollups = _delete_chunked('monthly_rollups', 'user_id')
+            users, hold_users = _delete_chunked('users', 'id')
+        result['trades'] += trades
+        result['users'] += users
+        result['max_lock_ms'] = max(result['max_lock_ms'], hold_trades, hold_tombstones, hold_rollups, hold_users)
+    if SHARDS > 1:
+        with _directory() as conn:
+            conn.execute("DELETE FROM users")
+            conn.commit()
+        _routes.clear()
+    _result_cache.clear()
+    import snapshot
+    snapshot.drop()
+    return result
 
+@instrument
+@routed
 def delete_user_data(username):
-    """Deletes specific user and all their trades."""
-    conn = get_connection()
-    c = conn.cursor()
-    # Find user id
-    c.execute("SELECT id FROM users WHERE username = ?", (username,))
-    res = c.fetchone()
-    if res:
-        user_id = res[0]
-        c.execute("DELETE FROM trades WHERE user_id = ?", (user_id,))
-        c.execute("DELETE FROM users WHERE id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+    """Deletes specific user and all their trades.
+
+    Trades and tombstones go in short chunked transactions; deleting the user row then
+    cascades to the rollups and anything written meanwhile. Returns {'trades', 'max_lock_ms'},
+    or None for an unknown user.
+    """
+    get_write_queue().flush()   # queued trades for this user must not outlive them
+    user_id = get_user_id(username)
+    if user_id is None:
+        return None
+    trades, hold_trades = _delete_chunked('trades', 'id', "user_id = ?", (user_id,))
+    # Nobody will sync this user again; their tombstones are dead weight
+    _, hold_tombstones = _delete_chunked('trade_tombstones', 'seq', "user_id = ?", (user_id,))
+    hold_user = get_write_queue().submit(_delete_user_row, user_id).result()
+    if SHARDS > 1:
+        with _directory() as conn:
+            conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            conn.commit()
+        _forget_route(user_id)
+    _result_cache.invalidate_user(user_id)
+    import snapshot
+    snapshot.drop(user_id)
+    return {'trades': trades, 'max_lock_ms': max(hold_trades, hold_tombstones, hold_user)}
+
+def _move_out(c, user_id, target):
+    # Runs on the source shard's writer thread inside its batch transaction, so the source
+    # cannot change under the copy and writes queued meanwhile simply wait their turn
+    c.execute("SELECT username, password_hash, data_version, session_generation FROM users WHERE id = ?", (user_id,))
+    username, password_hash, data_version, session_generation = c.fetchone()
+    c.execute("SELECT date, event, spent_cents, earned_cents, pnl_cents FROM trades WHERE user_id = ? ORDER BY id",
+              (user_id,))
+    moved = 0
+    with using(target), get_connection() as conn:
+        t = conn.cursor()
+        # Bumped version: cached reads hold the old shard's trade ids
+        t.execute('''INSERT INTO users (id, username, password_hash, data_version, session_generation)
+                     VALUES (?, ?, ?, ?, ?)''', (user_id, username, password_hash, data_version + 1, session_generation))
+        conn.commit()
+        try:
+            # Short target transactions; nothing routes here until the directory is flipped
+            while rows := c.fetchmany(MOVE_CHUNK_SIZE):
+                t.executemany('''INSERT INTO trades (user_id, date, event, spent_cents, earned_cents, pnl_cents)
+                                 VALUES (?, ?, ?, ?, ?, ?)''', [(user_id, *row) for row in rows])
+                conn.commit()
+                moved += len(rows)
+            _rebuild_rollups(t, user_id)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            t.execute("DELETE FROM users WHERE id = ?", (user_id,))   # cascades to the partial copy
+            conn.commit()
+            raise
+    with _directory() as conn:
+        conn.execute("UPDATE users SET shard = ? WHERE id = ?", (shard_paths().index(target), user_id))
+        conn.commit()
+    c.execute("DELETE FROM users WHERE id = ?", (user_id,))   # cascades to trades, rollups, tombstones
+    return moved
+
+@instrument
+def move_user(user_id, shard):
+    """Moves a user's account and trades to shard index `shard`. Returns the number of trades moved.
+
+    The copy runs as one operation on the source shard's write queue: other writes to that
+    shard wait for it, reads carry on. Trade ids are renumbered on the target. Other processes
+    keep routing the user to the old shard until their cached route expires (ROUTE_CACHE_S);
+    writes they send there in that window fail rather than land on the wrong shard.
+    """
+    if SHARDS <= 1:
+        raise ValueError("move_user needs TRADEFLOW_SHARDS > 1")
+    if not 0 <= shard < SHARDS:
+        raise ValueError(f"shard must be between 0 and {SHARDS - 1}")
+    _forget_route(user_id)
+    with _directory() as conn:
+        res = conn.execute("SELECT shard FROM users WHERE id = ?", (user_id,)).fetchone()
+    if res is None:
+        raise ValueError(f"unknown user id {user_id}")
+    if res[0] == shard:
+        return 0
+    paths = shard_paths()
+    moved = get_write_queue(paths[res[0]]).submit(_move_out, user_id, paths[shard]).result()
+    _forget_route(user_id)
+    _result_cache.invalidate_user(user_id)
+    import snapshot
+    snapshot.drop(user_id)
+    return moved
+
+def shard_load():
+    """Per-shard user and trade counts: [{'shard', 'path', 'users', 'trades'}]."""
+    load = []
+    for shard, path in enumerate(shard_paths()):
+        counts = _user_trade_counts(path)
+        load.append({'shard': shard, 'path': path, 'users': len(counts), 'trades': sum(counts.values())})
+    return load
+
+def _user_trade_counts(path):
+    with using(path), get_connection() as conn:
+        rows = conn.execute('''SELECT u.id, COUNT(t.id) FROM users u LEFT JOIN trades t ON t.user_id = u.id
+                               GROUP BY u.id''').fetchall()
+    return dict(rows)
+
+def plan_rebalance(max_moves=10):
+    """Greedy plan evening out trade counts across shards: [(user_id, from_shard, to_shard, trades)].
+
+    Each step moves the user from the busiest shard to the quietest whose ledger best halves
+    the gap between them, until the shards are within REBALANCE_TOLERANCE of the mean load.
+    """
+    counts = [_user_trade_counts(path) for path in shard_paths()]
+    loads = [sum(c.values()) for c in counts]
+    slack = REBALANCE_TOLERANCE * sum(loads) / len(loads)
+    moves = []
+    while len(moves) < max_moves:
+        src = max(range(len(loads)), key=loads.__getitem__)
+        dst = min(range(len(loads)), key=loads.__getitem__)
+        gap = loads[src] - loads[dst]
+        if gap <= slack:
+            break
+        candidates = [(abs(gap - 2 * n), uid, n) for uid, n in counts[src].items() if 0 < n < gap]
+        if not candidates:
+            break
+        _, uid, n = min(candidates)
+        moves.append((uid, src, dst, n))
+        counts[dst][uid] = counts[src].pop(uid)
+        loads[src] -= n
+        loads[dst] += n
+    return moves
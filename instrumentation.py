@@ -0,0 +1,142 @@
+"""Optional timing of db_manager calls and page renders, with a slow-query log.
+
+Enabled with TRADEFLOW_PROFILE=1. When it is off, `instrument` returns functions unchanged
+and `timed` hands back a shared no-op context, so the hot paths pay nothing.
+
+    TRADEFLOW_SLOW_QUERY_MS   calls at or above this many ms go to the slow log (default 250)
+    TRADEFLOW_SLOW_LOG        slow log path (default slow_queries.log next to this file)
+    TRADEFLOW_ADMINS          comma-separated usernames allowed to see the telemetry panel
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+ENABLED = os.environ.get("TRADEFLOW_PROFILE", "").lower() in ("1", "true", "yes")
+SLOW_QUERY_MS = float(os.environ.get("TRADEFLOW_SLOW_QUERY_MS", "250"))
+SLOW_LOG_PATH = os.environ.get("TRADEFLOW_SLOW_LOG", os.path.join(os.path.dirname(__file__), "slow_queries.log"))
+ADMIN_USERS = {name.strip() for name in os.environ.get("TRADEFLOW_ADMINS", "").split(",") if name.strip()}
+SAMPLES_PER_NAME = 5000          # latency samples kept per call/page name
+MAX_STATEMENTS_PER_CALL = 20
+
+_samples = {}
+_samples_lock = threading.Lock()
+_local = threading.local()
+_NO_OP = contextlib.nullcontext()
+_STRING_LITERAL = re.compile(r"[xX]?'(?:[^']|'')*'")
+
+_slow_log = logging.getLogger("tradeflow.slow")
+_slow_log.propagate = False
+
+def _slow_handler():
+    if not _slow_log.handlers:
+        handler = RotatingFileHandler(SLOW_LOG_PATH, maxBytes=5 * 1024 * 1024, backupCount=3)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        _slow_log.addHandler(handler)
+        _slow_log.setLevel(logging.INFO)
+    return _slow_log
+
+def trace_sql(statement):
+    """sqlite3 trace callback: collects statements run during the current instrumented call."""
+    statements = getattr(_local, 'statements', None)
+    if statements is not None and len(statements) < MAX_STATEMENTS_PER_CALL:
+        # Bound values arrive expanded; drop string literals so usernames/hashes never reach the log
+        statements.append(" ".join(_STRING_LITERAL.sub("?", statement).split()))
+
+@contextlib.contextmanager
+def capture():
+    """Collects the SQL this thread runs inside the block, e.g. one queued write on the writer thread."""
+    outer = getattr(_local, 'statements', None)
+    _local.statements = statements = []
+    try:
+        yield statements
+    finally:
+        _local.statements = outer
+
+def add_statements(statements):
+    """Counts SQL run on another thread towards the instrumented call in progress on this one."""
+    outer = getattr(_local, 'statements', None)
+    if outer is not None and statements:
+        outer.extend(statements[:MAX_STATEMENTS_PER_CALL - len(outer)])
+
+def _row_count(result):
+    if isinstance(result, tuple) and result and hasattr(result[0], '__len__'):
+        result = result[0]
+    if isinstance(result, (str, bytes, dict)) or not hasattr(result, '__len__'):
+        return None
+    return len(result)
+
+def record(name, elapsed_ms, rows=None, statements=None):
+    with _samples_lock:
+        bucket = _samples.get(name)
+        if bucket is None:
+            bucket = _samples[name] = deque(maxlen=SAMPLES_PER_NAME)
+        bucket.append(elapsed_ms)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        _slow_handler().info(json.dumps({
+            'call': name, 'ms': round(elapsed_ms, 2), 'rows': rows, 'sql': statements or [],
+        }))
+
+def instrument(fn):
+    """Records wall time, rows returned and SQL issued for every call to `fn` (if profiling is on)."""
+    if not ENABLED:
+        return fn
+    name = f"db.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_local, 'statements', None)
+        _local.statements = statements = []
+        result = None
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            _local.statements = outer
+            if outer is not None:
+                # Nested instrumented calls also count towards the caller's SQL
+                outer.extend(statements[:MAX_STATEMENTS_PER_CALL - len(outer)])
+            record(name, elapsed_ms, _row_count(result), statements)
+    return wrapper
+
+@contextlib.contextmanager
+def _timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - start) * 1000)
+
+def timed(name):
+    """`with timed("page.Trade History"): ...` records the block's wall time when profiling is on."""
+    return _timed(name) if ENABLED else _NO_OP
+
+def is_admin(username):
+    return ENABLED and username in ADMIN_USERS
+
+def latency_report():
+    """Per-name call count and p50/p95/p99/max latency in ms, slowest p95 first."""
+    with _samples_lock:
+        snapshot = {name: sorted(bucket) for name, bucket in _samples.items()}
+    report = []
+    for name, values in snapshot.items():
+        if not values:
+            continue
+        pick = lambda q: values[min(len(values) - 1, int(len(values) * q))]
+        report.append({
+            'name': name, 'count': len(values), 'p50_ms': round(pick(0.50), 2), 'p95_ms': round(pick(0.95), 2),
+            'p99_ms': round(pick(0.99), 2), 'max_ms': round(values[-1], 2),
+        })
+    return sorted(report, key=lambda r: r['p95_ms'], reverse=True)
+
+def reset():
+    with _samples_lock:
+        _samples.clear()
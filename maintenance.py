@@ -0,0 +1,143 @@
+"""Background database maintenance: tombstone pruning, planner statistics, incremental vacuum, WAL checkpoints.
+
+    TRADEFLOW_MAINTENANCE_INTERVAL_S   seconds between scheduled runs (default 3600, 0 disables)
+    TRADEFLOW_VACUUM_STEP_PAGES        free pages handed back per incremental_vacuum transaction (default 256)
+    TRADEFLOW_TOMBSTONE_RETENTION_S    age at which trade tombstones are pruned (default 86400)
+
+Every step runs in its own short transaction so sessions keep writing while maintenance
+runs. Each report records the space reclaimed and the longest time the write lock was held.
+"""
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import db_manager as db
+
+INTERVAL_S = float(os.environ.get("TRADEFLOW_MAINTENANCE_INTERVAL_S", "3600"))
+VACUUM_STEP_PAGES = int(os.environ.get("TRADEFLOW_VACUUM_STEP_PAGES", "256"))
+ANALYZE_EVERY = 24         # scheduled runs between full ANALYZE passes; PRAGMA optimize runs every time
+ANALYSIS_LIMIT = 1000      # rows sampled per index by ANALYZE/optimize, keeps them short on big tables
+
+_log = logging.getLogger("tradeflow.maintenance")
+_last_report = None
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def _pragma(c, name):
+    c.execute(f"PRAGMA {name}")
+    return c.fetchone()[0]
+
+def _maintain_shard(analyze, holds):
+    """Maintenance on the current shard; every write-lock hold is appended to `holds`."""
+    with db.get_connection() as conn:
+        c = conn.cursor()
+        page_size = _pragma(c, "page_size")
+        pages_before = _pragma(c, "page_count")
+        free_before = _pragma(c, "freelist_count")
+
+        c.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        step = time.perf_counter()
+        c.execute("ANALYZE" if analyze else "PRAGMA optimize")
+        c.fetchall()
+        holds.append(time.perf_counter() - step)
+
+        free = free_before
+        while free:
+            step = time.perf_counter()
+            c.execute("BEGIN IMMEDIATE")
+            # Each result row is one freed page; fetching drives the pragma to completion
+            c.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+            c.fetchall()
+            conn.commit()
+            holds.append(time.perf_counter() - step)
+            remaining = _pragma(c, "freelist_count")
+            if remaining >= free:
+                break   # auto_vacuum is not INCREMENTAL on this file; nothing can be reclaimed
+            free = remaining
+
+        # PASSIVE never waits for readers; the file shrinks once the WAL is folded back
+        c.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        busy, wal_pages, checkpointed = c.fetchone()
+        pages_after = _pragma(c, "page_count")
+    return {
+        'size_before_bytes': pages_before * page_size,
+        'size_after_bytes': pages_after * page_size,
+        'reclaimed_bytes': (free_before - free) * page_size,
+        'free_pages_before': free_before,
+        'free_pages_after': free,
+        'wal_pages': wal_pages,
+        'wal_checkpointed': checkpointed,
+    }
+
+def run_maintenance(analyze=False):
+    """One maintenance pass over every database shard. Returns a report dict (totals across shards).
+
+    Prunes trade tombstones older than db.TOMBSTONE_RETENTION_S, refreshes planner statistics
+    (PRAGMA optimize, or a full ANALYZE when `analyze`), returns free pages to the OS in
+    VACUUM_STEP_PAGES steps and runs a passive WAL checkpoint.
+    """
+    global _last_report
+    started = time.perf_counter()
+    holds = []
+    report = {'finished_at': None, 'analyzed': bool(analyze), 'shards': 0}
+    for path in db.shard_paths():
+        with db.using(path):
+            pruned, hold_ms = db.prune_tombstones()
+            holds.append(hold_ms / 1000)
+            report['tombstones_pruned'] = report.get('tombstones_pruned', 0) + pruned
+            for key, value in _maintain_shard(analyze, holds).items():
+                report[key] = report.get(key, 0) + value
+        report['shards'] += 1
+    report.update({
+        'finished_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'max_lock_ms': round(max(holds) * 1000, 3),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+    })
+    _last_report = report
+    _log.info("maintenance: reclaimed %d bytes, max lock %.1f ms", report['reclaimed_bytes'], report['max_lock_ms'])
+    return report
+
+def last_report():
+    """The most recent run_maintenance report in this process, or None."""
+    return _last_report
+
+class MaintenanceScheduler:
+    """Daemon thread running run_maintenance every `interval_s` seconds."""
+
+    def __init__(self, interval_s=INTERVAL_S):
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tradeflow-maintenance", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        runs = 0
+        while not self._stop.wait(self.interval_s):
+            runs += 1
+            try:
+                run_maintenance(analyze=runs % ANALYZE_EVERY == 0)
+            except sqlite3.Error:
+                # Try again next interval (e.g. the database was busy past busy_timeout)
+                _log.exception("scheduled maintenance failed")
+
+def start_scheduler():
+    """Starts the process-wide scheduler once; later calls are no-ops. None when disabled."""
+    global _scheduler
+    if INTERVAL_S <= 0:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = MaintenanceScheduler(INTERVAL_S).start()
+            atexit.register(_scheduler.stop)
+        return _scheduler
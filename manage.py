@@ -0,0 +1,125 @@
+"""Maintenance commands for the TradeFlow database.
+
+    python manage.py rebuild-rollups [--user-id ID]
+    python manage.py import-csv USERNAME FILE [--chunk-size N]
+    python manage.py export USERNAME FILE [--format csv|parquet] [--start DATE] [--end DATE] [--event EVENT]
+    python manage.py refresh-snapshot USERNAME [--rebuild]
+    python manage.py maintain [--analyze]
+    python manage.py migrate
+    python manage.py shards
+    python manage.py move-user USERNAME SHARD
+    python manage.py rebalance [--max-moves N] [--dry-run]
+"""
+import argparse
+import db_manager as db
+import maintenance
+import snapshot
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TradeFlow database maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_rollups = sub.add_parser("rebuild-rollups", help="Recompute monthly_rollups from the trades table")
+    p_rollups.add_argument("--user-id", type=int, help="Only rebuild this user's rows")
+
+    p_import = sub.add_parser("import-csv", help="Bulk import trades from a CSV or broker export")
+    p_import.add_argument("username")
+    p_import.add_argument("file")
+    p_import.add_argument("--chunk-size", type=int, default=db.IMPORT_CHUNK_SIZE)
+
+    p_export = sub.add_parser("export", help="Stream a user's full trade ledger to CSV or Parquet")
+    p_export.add_argument("username")
+    p_export.add_argument("file")
+    p_export.add_argument("--format", choices=db.EXPORT_FORMATS, default="csv")
+    p_export.add_argument("--start", help="First trade date to include (YYYY-MM-DD)")
+    p_export.add_argument("--end", help="Last trade date to include (YYYY-MM-DD)")
+    p_export.add_argument("--event", help="Only export this market")
+
+    p_snapshot = sub.add_parser("refresh-snapshot", help="Bring a user's columnar (Parquet) snapshot up to date")
+    p_snapshot.add_argument("username")
+    p_snapshot.add_argument("--rebuild", action="store_true", help="Discard the snapshot and rebuild it from SQLite")
+
+    p_maintain = sub.add_parser("maintain", help="Refresh planner statistics and return free pages to the OS")
+    p_maintain.add_argument("--analyze", action="store_true", help="Run a full ANALYZE instead of PRAGMA optimize")
+
+    sub.add_parser("migrate", help="Apply pending schema migrations and show the schema version")
+
+    sub.add_parser("shards", help="Show users and trades per database shard")
+
+    p_move = sub.add_parser("move-user", help="Move a user's account and trades to another shard")
+    p_move.add_argument("username")
+    p_move.add_argument("shard", type=int)
+
+    p_rebalance = sub.add_parser("rebalance", help="Move users between shards to even out trade counts")
+    p_rebalance.add_argument("--max-moves", type=int, default=10)
+    p_rebalance.add_argument("--dry-run", action="store_true", help="Only print the planned moves")
+
+    args = parser.parse_args(argv)
+    db.init_db()
+
+    if args.command == "rebuild-rollups":
+        count = db.rebuild_monthly_rollups(args.user_id)
+        print(f"Rebuilt {count} monthly rollup rows")
+
+    elif args.command == "import-csv":
+        user_id = db.get_user_id(args.username)
+        if user_id is None:
+            parser.error(f"unknown user: {args.username}")
+        result = db.import_trades_csv(user_id, args.file, chunk_size=args.chunk_size,
+                                      progress=lambda n: print(f"\r{n:,} rows read", end="", flush=True))
+        print(f"\nImported {result['inserted']:,} trades, rejected {result['rejected']:,}")
+        if result['rejected']:
+            print(result['rejected_rows'].to_string())
+
+    elif args.command == "export":
+        user_id = db.get_user_id(args.username)
+        if user_id is None:
+            parser.error(f"unknown user: {args.username}")
+        rows = db.export_trades(user_id, args.file, args.format, start=args.start, end=args.end, event=args.event)
+        print(f"Exported {rows:,} trades to {args.file}")
+
+    elif args.command == "refresh-snapshot":
+        if snapshot.pa is None:
+            parser.error("snapshots need the pyarrow package (pip install pyarrow)")
+        user_id = db.get_user_id(args.username)
+        if user_id is None:
+            parser.error(f"unknown user: {args.username}")
+        meta = snapshot.refresh(user_id, rebuild=args.rebuild)
+        print(f"Snapshot at trade id {meta['hwm']}: {len(meta['parts'])} part file(s), {len(meta['deleted'])} pending deletions")
+
+    elif args.command == "maintain":
+        report = maintenance.run_maintenance(analyze=args.analyze)
+        print(f"Reclaimed {report['reclaimed_bytes']:,} bytes ({report['size_before_bytes']:,} -> {report['size_after_bytes']:,}), "
+              f"{report['tombstones_pruned']:,} tombstones pruned, max lock hold {report['max_lock_ms']:.1f} ms")
+
+    elif args.command == "migrate":
+        for path in db.shard_paths():
+            with db.using(path), db.get_connection() as conn:
+                print(f"{path}: schema at version {db.schema_version(conn.cursor())}")
+
+    elif args.command == "shards":
+        for load in db.shard_load():
+            print(f"shard {load['shard']}: {load['users']:,} users, {load['trades']:,} trades  ({load['path']})")
+
+    elif args.command == "move-user":
+        if db.SHARDS <= 1:
+            parser.error("sharding is off (set TRADEFLOW_SHARDS)")
+        user_id = db.get_user_id(args.username)
+        if user_id is None:
+            parser.error(f"unknown user: {args.username}")
+        moved = db.move_user(user_id, args.shard)
+        print(f"Moved {args.username} to shard {args.shard} ({moved:,} trades)")
+
+    elif args.command == "rebalance":
+        if db.SHARDS <= 1:
+            parser.error("sharding is off (set TRADEFLOW_SHARDS)")
+        moves = db.plan_rebalance(args.max_moves)
+        if not moves:
+            print("Shards are balanced")
+        for user_id, src, dst, trades in moves:
+            print(f"user {user_id}: shard {src} -> {dst} ({trades:,} trades)")
+            if not args.dry_run:
+                db.move_user(user_id, dst)
+
+if __name__ == "__main__":
+    main()
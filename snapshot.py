@@ -0,0 +1,218 @@
+"""Optional per-user columnar snapshots of the trades table.
+
+For very large ledgers, reading every trade out of SQLite on each analytics recompute is
+the dominant cost. With TRADEFLOW_SNAPSHOTS=1 (and pyarrow installed) each user gets a
+directory of Parquet part files that analytics and export read instead. SQLite stays the
+source of truth: a refresh appends trades above the snapshot's id high-water mark as a new
+part and records deletions from the trade_tombstones change feed as a deletion list that
+readers filter out, or rebuilds if those deletions were pruned from the feed meanwhile. Parts and deletions are compacted into a single file once they pile up.
+"""
+import json
+import os
+import shutil
+import threading
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:   # optional dependency; snapshots stay disabled
+    pa = None
+
+import db_manager as db
+
+ENABLED = os.environ.get("TRADEFLOW_SNAPSHOTS", "0") == "1" and pa is not None
+SNAPSHOT_DIR = os.environ.get("TRADEFLOW_SNAPSHOT_DIR")   # default: next to the database file
+
+# Compaction thresholds
+SNAPSHOT_MAX_PARTS = 16
+SNAPSHOT_MAX_DELETED = 1000
+
+META_FILE = "meta.json"
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _root():
+    return SNAPSHOT_DIR or db.DB_PATH + ".snapshots"
+
+def _user_dir(user_id):
+    return os.path.join(_root(), f"user_{int(user_id)}")
+
+def _user_lock(user_id):
+    with _locks_lock:
+        return _locks.setdefault(user_id, threading.Lock())
+
+def _schema():
+    return pa.schema([
+        ('id', pa.int64()), ('date', pa.int32()), ('month', pa.int32()), ('event', pa.string()),
+        ('spent_cents', pa.int64()), ('earned_cents', pa.int64()), ('pnl_cents', pa.int64()),
+    ])
+
+def _to_table(frame):
+    return pa.Table.from_pandas(frame.astype({'event': str}), schema=_schema(), preserve_index=False)
+
+def _load_meta(path):
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_meta(path, meta):
+    tmp = os.path.join(path, f"{META_FILE}.{uuid.uuid4().hex}")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, META_FILE))
+
+def _dataset(path, meta):
+    fmt = ds.ParquetFileFormat(read_options=ds.ParquetReadOptions(dictionary_columns=['event']))
+    return ds.dataset([os.path.join(path, part) for part in meta['parts']], schema=_schema(), format=fmt)
+
+def _live_filter(meta, expr=None):
+    if meta['deleted']:
+        alive = ~ds.field('id').isin(pa.array(meta['deleted'], pa.int64()))
+        expr = alive if expr is None else expr & alive
+    return expr
+
+def _remove_stale(path, meta):
+    keep = set(meta['parts']) | {META_FILE}
+    for name in os.listdir(path):
+        if name not in keep and not name.startswith(META_FILE):
+            os.remove(os.path.join(path, name))
+
+def _rebuild(user_id, path):
+    """Writes a fresh single-part snapshot from SQLite in bounded chunks."""
+    os.makedirs(path, exist_ok=True)
+    part = f"snap-{uuid.uuid4().hex}.parquet"
+    hwm = 0
+    with db.get_connection() as conn:
+        c = conn.cursor()
+        c.execute("BEGIN")   # one consistent read of trades and tombstones
+        try:
+            c.execute(db.TOMBSTONE_SEQ, (user_id, user_id))
+            tomb_seq = c.fetchone()[0]
+            with pq.ParquetWriter(os.path.join(path, part), _schema()) as writer:
+                for chunk in db.iter_user_trades(user_id):
+                    writer.write_table(_to_table(chunk))
+                    hwm = max(hwm, int(chunk['id'].max()))
+        finally:
+            conn.rollback()
+    meta = {'hwm': hwm, 'tomb_seq': tomb_seq, 'parts': [part], 'deleted': []}
+    _save_meta(path, meta)
+    _remove_stale(path, meta)
+    return meta
+
+def _compact(path, meta):
+    part = f"snap-{uuid.uuid4().hex}.parquet"
+    table = _dataset(path, meta).to_table(filter=_live_filter(meta))
+    table = table.sort_by([('date', 'ascending'), ('id', 'ascending')]).cast(_schema())
+    pq.write_table(table, os.path.join(path, part))
+    meta = dict(meta, parts=[part], deleted=[])
+    _save_meta(path, meta)
+    _remove_stale(path, meta)
+    return meta
+
+@db.routed
+def refresh(user_id, rebuild=False):
+    """Brings a user's snapshot up to date with SQLite. Returns its metadata."""
+    path = _user_dir(user_id)
+    with _user_lock(user_id):
+        meta = None if rebuild else _load_meta(path)
+        if meta is None:
+            return _rebuild(user_id, path)
+
+        with db.get_connection() as conn:
+            c = conn.cursor()
+            c.execute("BEGIN")
+            try:
+                c.execute("SELECT tombstone_horizon FROM users WHERE id = ?", (user_id,))
+                row = c.fetchone()
+                pruned = row is not None and row[0] > meta['tomb_seq']
+                new = db._read_trades(f'''SELECT {db.TRADE_COLUMNS} FROM trades
+                                          WHERE user_id = ? AND id > ? ORDER BY id''', (user_id, meta['hwm']))
+                c.execute("SELECT seq, trade_id FROM trade_tombstones WHERE user_id = ? AND seq > ? ORDER BY seq",
+                          (user_id, meta['tomb_seq']))
+                tombstones = c.fetchall()
+            finally:
+                conn.rollback()
+        if pruned:
+            # Deletions since the last refresh have left the change feed
+            return _rebuild(user_id, path)
+        if new.empty and not tombstones:
+            return meta
+
+        meta = dict(meta)
+        if not new.empty:
+            part = f"part-{int(new['id'].iloc[0])}-{uuid.uuid4().hex[:8]}.parquet"
+            pq.write_table(_to_table(new), os.path.join(path, part))
+            meta['parts'] = meta['parts'] + [part]
+            meta['hwm'] = int(new['id'].iloc[-1])
+        if tombstones:
+            meta['deleted'] = sorted(set(meta['deleted']).union(trade_id for _, trade_id in tombstones))
+            meta['tomb_seq'] = tombstones[-1][0]
+
+        if len(meta['parts']) > SNAPSHOT_MAX_PARTS or len(meta['deleted']) > SNAPSHOT_MAX_DELETED:
+            return _compact(path, meta)
+        _save_meta(path, meta)
+        return meta
+
+def _read(user_id, expr=None):
+    path = _user_dir(user_id)
+    meta = refresh(user_id)
+    try:
+        return _dataset(path, meta).to_table(filter=_live_filter(meta, expr))
+    except (OSError, pa.ArrowException):
+        # A part went missing (e.g. compacted by another process); start over from SQLite
+        meta = refresh(user_id, rebuild=True)
+        return _dataset(path, meta).to_table(filter=_live_filter(meta, expr))
+
+def _filter(event=None, start=None, end=None):
+    expr = None
+    for clause in (ds.field('date') >= db.date_key(start) if start is not None else None,
+                   ds.field('date') <= db.date_key(end) if end is not None else None,
+                   ds.field('event') == event if event is not None else None):
+        if clause is not None:
+            expr = clause if expr is None else expr & clause
+    return expr
+
+def iter_trades(user_id, start=None, end=None, event=None, chunk_size=db.EXPORT_CHUNK_SIZE):
+    """Snapshot counterpart of db.iter_user_trades: oldest-first DataFrame chunks with the same filters."""
+    table = _read(user_id, _filter(event, start, end)).sort_by([('date', 'ascending'), ('id', 'ascending')])
+    for offset in range(0, table.num_rows, chunk_size):
+        yield table.slice(offset, chunk_size).to_pandas().astype(db.TRADE_DTYPES)
+
+def pnl_series(user_id, event=None, start=None, end=None):
+    """Snapshot counterpart of db.get_pnl_series: date, spent_cents and pnl_cents in trade order."""
+    table = _read(user_id, _filter(event, start, end)).sort_by([('date', 'ascending'), ('id', 'ascending')])
+    return table.select(['date', 'spent_cents', 'pnl_cents']).to_pandas()
+
+def trade_breakdown(user_id, by, event=None, start=None, end=None):
+    """Snapshot counterpart of db.get_trade_breakdown: TRADE_AGGREGATES columns per key, ordered by it."""
+    table = _read(user_id, _filter(event, start, end))
+    pnl = table['pnl_cents']
+    date = pc.cast(table['date'], pa.int64())
+    keys = {'event': table['event'].cast(pa.string()), 'day': date, 'month': pc.cast(table['month'], pa.int64()),
+            'year': pc.divide(date, 10000)}
+    table = pa.table({
+        by: keys[by], 'spent_cents': table['spent_cents'], 'earned_cents': table['earned_cents'], 'pnl_cents': pnl,
+        'wins': pc.cast(pc.greater(pnl, 0), pa.int64()),
+        'gross_profit_cents': pc.max_element_wise(pnl, 0), 'gross_loss_cents': pc.negate(pc.min_element_wise(pnl, 0)),
+        'date': date,
+    })
+    out = table.group_by(by).aggregate([
+        ('pnl_cents', 'count'), ('spent_cents', 'sum'), ('earned_cents', 'sum'), ('pnl_cents', 'sum'),
+        ('wins', 'sum'), ('gross_profit_cents', 'sum'), ('gross_loss_cents', 'sum'), ('date', 'min'), ('date', 'max'),
+    ]).sort_by(by)
+    columns = [by, 'trades', 'spent_cents', 'earned_cents', 'pnl_cents', 'wins',
+               'gross_profit_cents', 'gross_loss_cents', 'first_date', 'last_date']
+    frame = out.select([by, 'pnl_cents_count', 'spent_cents_sum', 'earned_cents_sum', 'pnl_cents_sum', 'wins_sum',
+                        'gross_profit_cents_sum', 'gross_loss_cents_sum', 'date_min', 'date_max']).to_pandas()
+    frame.columns = columns
+    return frame
+
+def drop(user_id=None):
+    """Deletes one user's snapshot, or every snapshot when `user_id` is None."""
+    shutil.rmtree(_root() if user_id is None else _user_dir(user_id), ignore_errors=True)
@@ -0,0 +1,85 @@
+"""Unit tests for the headless metric functions in analytics."""
+import math
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics
+
+def totals(pnls, spent=100):
+    """TRADE_AGGREGATES-style cent totals for trades of `spent` cents each with these P&Ls."""
+    return {
+        'trades': len(pnls), 'spent_cents': spent * len(pnls), 'earned_cents': spent * len(pnls) + sum(pnls),
+        'pnl_cents': sum(pnls), 'wins': sum(p > 0 for p in pnls),
+        'gross_profit_cents': sum(p for p in pnls if p > 0), 'gross_loss_cents': -sum(p for p in pnls if p < 0),
+    }
+
+def test_streaks_counts_runs_and_current_run():
+    pnl = pd.Series([5, 3, -1, -2, -4, 0, 7, 2])
+    assert analytics.streaks(pnl) == {'longest_win_streak': 2, 'longest_loss_streak': 3, 'current_streak': 2}
+
+def test_streaks_current_losing_run_is_negative():
+    assert analytics.streaks(pd.Series([1, -1, -1]))['current_streak'] == -2
+
+def test_streaks_flat_trade_ends_a_run_without_starting_one():
+    result = analytics.streaks(pd.Series([1, 1, 0, 1, 1]))
+    assert result['longest_win_streak'] == 2
+    assert result['current_streak'] == 2
+
+def test_streaks_empty():
+    assert analytics.streaks(pd.Series([], dtype='int64')) == {
+        'longest_win_streak': 0, 'longest_loss_streak': 0, 'current_streak': 0}
+
+def test_drawdown_from_peak():
+    # Equity in dollars: 1, 3, 1.5, 2.5, 0.5 -> worst fall is 3 -> 0.5
+    result = analytics.drawdown(pd.Series([100, 200, -150, 100, -200]))
+    assert result['max_drawdown'] == 2.5
+    assert math.isclose(result['max_drawdown_pct'], 2.5 / 3 * 100)
+
+def test_drawdown_from_a_flat_start_counts_early_losses():
+    result = analytics.drawdown(pd.Series([-100, -50, 300]))
+    assert result == {'max_drawdown': 1.5, 'max_drawdown_pct': 0.0}
+
+def test_drawdown_is_positive_zero_without_a_fall():
+    for pnl in ([100, 200, 300], [], [0, 0]):
+        result = analytics.drawdown(pd.Series(pnl, dtype='int64'))
+        assert result == {'max_drawdown': 0.0, 'max_drawdown_pct': 0.0}
+        assert math.copysign(1, result['max_drawdown']) == 1
+        assert math.copysign(1, result['max_drawdown_pct']) == 1
+
+def test_summary_metrics():
+    result = analytics.summary_metrics(totals([50, -20, 30, -10]))
+    assert result['spent'] == 4.0
+    assert result['earned'] == 4.5
+    assert result['pnl'] == 0.5
+    assert result['roi'] == 12.5
+    assert result['count'] == 4
+    assert result['avg_trade'] == 1.0
+    assert result['win_rate'] == 50.0
+    assert math.isclose(result['profit_factor'], 80 / 30)
+
+def test_summary_metrics_profit_factor_edges():
+    assert analytics.summary_metrics(totals([10, 20]))['profit_factor'] == float('inf')
+    assert analytics.summary_metrics(totals([0, 0]))['profit_factor'] == 0.0
+
+def test_summary_metrics_without_trades():
+    result = analytics.summary_metrics(totals([]))
+    assert result['roi'] == result['avg_trade'] == result['win_rate'] == result['profit_factor'] == 0.0
+    assert result['count'] == 0
+
+def test_pnl_series_reverses_a_newest_first_frame_and_filters_a_market():
+    trades = pd.DataFrame({'id': [3, 2, 1], 'date': [20240103, 20240102, 20240101], 'event': ['A', 'B', 'A'],
+                           'spent_cents': [30, 20, 10], 'pnl_cents': [3, -2, 1]})
+    series = analytics.pnl_series(trades, 'A')
+    assert list(series.columns) == ['date', 'spent_cents', 'pnl_cents']
+    assert series['date'].tolist() == [20240101, 20240103]
+    assert series['pnl_cents'].tolist() == [1, 3]
+
+def test_rolling_roi_window():
+    series = pd.DataFrame({'date': [1, 2, 3], 'spent_cents': [100, 100, 0], 'pnl_cents': [10, -30, 5]})
+    roll = analytics.rolling_roi(series, window=2)
+    assert roll['trade_no'].tolist() == [1, 2, 3]
+    assert roll['rolling_roi'].tolist() == [10.0, -10.0, -25.0]
@@ -0,0 +1,95 @@
+"""Request handling in the headless API, driven through its router."""
+import asyncio
+import json
+import os
+import sys
+from http import HTTPStatus
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api
+import auth
+import db_manager as db
+
+@pytest.fixture(autouse=True)
+def server_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "tradeflow.db"))
+    monkeypatch.setattr(db, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(auth, "_key", b"test-signing-key")
+    monkeypatch.setattr(auth, "_failures", {})
+    monkeypatch.setattr(auth, "_in_flight", {})
+    monkeypatch.setattr(api, "_tokens", api.TokenCache())
+    db.init_db()
+    db.create_user("alice", "pw")
+    yield
+    db.close_connections()
+
+def call(method, path, body=None, token=None, raw=None, **params):
+    """(status, payload) for one request; ApiErrors come back as their status and message."""
+    headers = {'authorization': f"Bearer {token}"} if token else {}
+    if raw is None:
+        raw = json.dumps(body).encode('utf-8') if body is not None else b""
+    try:
+        return asyncio.run(api._dispatch(method, path, params, headers, raw))
+    except api.ApiError as e:
+        return e.status, {'error': str(e)}
+
+def login():
+    status, payload = call('POST', '/api/token', {'username': 'alice', 'password': 'pw'})
+    assert status == HTTPStatus.OK
+    return payload['token']
+
+def test_token_then_submit_and_list():
+    token = login()
+    status, payload = call('POST', '/api/trades', {'date': '2024-03-01', 'event': 'BTC', 'spent': 100, 'earned': 125.5},
+                           token=token)
+    assert status == HTTPStatus.CREATED
+    status, payload = call('GET', '/api/trades', token=token)
+    assert status == HTTPStatus.OK
+    assert [(t['event'], t['pnl']) for t in payload['trades']] == [('BTC', 25.5)]
+    status, payload = call('GET', '/api/metrics', token=token)
+    assert status == HTTPStatus.OK
+    assert (payload['count'], payload['pnl']) == (1, 25.5)
+
+def test_bulk_submission_is_all_or_nothing():
+    token = login()
+    trades = [{'date': '2024-03-01', 'event': 'BTC', 'spent': 1, 'earned': 2},
+              {'date': 'not a date', 'event': 'BTC', 'spent': 1, 'earned': 2}]
+    status, payload = call('POST', '/api/trades/bulk', {'trades': trades}, token=token)
+    assert status == HTTPStatus.BAD_REQUEST
+    assert payload['error'].startswith("trades[1]")
+    assert call('GET', '/api/trades', token=token)[1]['trades'] == []
+
+@pytest.mark.parametrize("body", [None, {}, {'username': 'alice'}, {'username': 'alice', 'password': 5}])
+def test_token_rejects_malformed_credentials(body):
+    assert call('POST', '/api/token', body)[0] == HTTPStatus.BAD_REQUEST
+
+def test_bad_requests_are_400():
+    token = login()
+    assert call('POST', '/api/trades', {'date': '2024-03-01', 'event': 'BTC', 'spent': -1, 'earned': 0},
+                token=token)[0] == HTTPStatus.BAD_REQUEST
+    assert call('GET', '/api/trades', token=token, limit='ten')[0] == HTTPStatus.BAD_REQUEST
+    assert call('GET', '/api/trades', token=token, cursor='nope')[0] == HTTPStatus.BAD_REQUEST
+    assert call('POST', '/api/trades', token=token, raw=b"{not json")[0] == HTTPStatus.BAD_REQUEST
+
+def test_missing_invalid_and_revoked_tokens_are_401():
+    assert call('GET', '/api/trades')[0] == HTTPStatus.UNAUTHORIZED
+    assert call('GET', '/api/trades', token="not.a-token")[0] == HTTPStatus.UNAUTHORIZED
+    assert call('POST', '/api/token', {'username': 'alice', 'password': 'wrong'})[0] == HTTPStatus.UNAUTHORIZED
+    token = login()
+    auth.logout(db.get_user_id("alice"))
+    api._tokens = api.TokenCache()   # as if the cached verification had expired
+    assert call('GET', '/api/trades', token=token)[0] == HTTPStatus.UNAUTHORIZED
+
+def test_repeated_failed_logins_are_429(monkeypatch):
+    monkeypatch.setattr(auth, "LOGIN_MAX_FAILURES", 2)
+    for _ in range(2):
+        assert call('POST', '/api/token', {'username': 'alice', 'password': 'wrong'})[0] == HTTPStatus.UNAUTHORIZED
+    assert call('POST', '/api/token', {'username': 'alice', 'password': 'pw'})[0] == HTTPStatus.TOO_MANY_REQUESTS
+
+def test_unknown_routes_and_methods():
+    assert call('GET', '/api/nope')[0] == HTTPStatus.NOT_FOUND
+    assert call('DELETE', '/api/trades')[0] == HTTPStatus.METHOD_NOT_ALLOWED
+    assert call('GET', '/api/health')[0] == HTTPStatus.OK
@@ -0,0 +1,88 @@
+"""Login rate limiting and session tokens in auth."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth
+import db_manager as db
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(auth, "_failures", {})
+    monkeypatch.setattr(auth, "_in_flight", {})
+    monkeypatch.setattr(auth, "_last_sweep", 0.0)
+    monkeypatch.setattr(auth, "LOGIN_MAX_FAILURES", 3)
+    monkeypatch.setattr(auth, "LOGIN_WINDOW_S", 60)
+
+@pytest.fixture
+def user_id(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "tradeflow.db"))
+    monkeypatch.setattr(db, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(auth, "_key", b"test-signing-key")
+    db.init_db()
+    db.create_user("alice", "pw")
+    yield db.get_user_id("alice")
+    db.close_connections()
+
+def test_in_flight_attempts_count_against_the_limit():
+    for _ in range(3):
+        auth._reserve_attempt("alice")
+    with pytest.raises(auth.RateLimitError):
+        auth._reserve_attempt("alice")
+    auth._reserve_attempt("bob")   # limits are per username
+
+def test_success_releases_the_attempt_and_clears_failures():
+    for _ in range(2):
+        auth._reserve_attempt("alice")
+        auth._record_result("alice", False)
+    auth._reserve_attempt("alice")
+    auth._record_result("alice", True)
+    assert "alice" not in auth._failures
+    assert "alice" not in auth._in_flight
+    for _ in range(3):
+        auth._reserve_attempt("alice")
+
+def test_errors_release_the_attempt_without_counting_a_failure():
+    auth._reserve_attempt("alice")
+    auth._record_result("alice", None)
+    assert auth._in_flight == {}
+    assert auth._failures == {}
+
+def test_failures_expire_with_the_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth.time, "monotonic", lambda: now[0])
+    for _ in range(3):
+        auth._reserve_attempt("alice")
+        auth._record_result("alice", False)
+    with pytest.raises(auth.RateLimitError) as e:
+        auth._reserve_attempt("alice")
+    assert e.value.retry_after == 60
+    now[0] += 61
+    auth._reserve_attempt("alice")
+
+def test_sweep_forgets_usernames_that_are_never_retried(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth.time, "monotonic", lambda: now[0])
+    for i in range(50):
+        auth._reserve_attempt(f"guess{i}")
+        auth._record_result(f"guess{i}", False)
+    assert len(auth._failures) == 50
+    now[0] += 61
+    auth._reserve_attempt("alice")
+    assert auth._failures == {}
+
+def test_login_rate_limit_is_raised_before_bcrypt(user_id):
+    for _ in range(3):
+        assert auth.login("alice", "wrong").result() == (None, None)
+    with pytest.raises(auth.RateLimitError):
+        auth.login("alice", "pw")
+
+def test_session_tokens_verify_until_logout(user_id):
+    token = auth.issue_session_token(user_id, "alice")
+    assert auth.verify_session_token(token) == (user_id, "alice")
+    assert auth.verify_session_token(token[:-2] + "xx") == (None, None)
+    auth.logout(user_id)
+    assert auth.verify_session_token(token) == (None, None)
@@ -0,0 +1,48 @@
+"""EXPLAIN QUERY PLAN checks that the per-user trade reads keep using their indexes."""
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_manager as db
+
+@pytest.fixture
+def user_id(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "tradeflow.db"))
+    monkeypatch.setattr(db, "BCRYPT_ROUNDS", 4)
+    db.init_db()
+    db.create_user("planner", "pw")
+    uid = db.get_user_id("planner")
+    db.submit_trades(uid, [(datetime.date(2024, 1, 1 + i % 28), ["BTC", "ETH", "ASX"][i % 3], 100, 90 + i)
+                           for i in range(60)]).result()
+    yield uid
+    db.close_connections()
+
+def query_plans(fn, *args):
+    """EXPLAIN QUERY PLAN details of every SELECT on trades that `fn(*args)` runs."""
+    statements = []
+    with db.get_connection() as conn:
+        # The pool is re-entrant per thread, so `fn` runs its queries on this same connection
+        conn.set_trace_callback(statements.append)
+        try:
+            fn(*args)
+        finally:
+            conn.set_trace_callback(None)
+        plans = []
+        for sql in statements:
+            if sql.lstrip().upper().startswith("SELECT") and "FROM trades" in sql:
+                plans.append([row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)])
+    assert plans, "no query on trades was traced"
+    return plans
+
+def test_get_user_trades_uses_date_index_without_sort(user_id):
+    for details in query_plans(db.get_user_trades.uncached, user_id):
+        assert any(d.startswith("SEARCH trades USING INDEX idx_trades_user_date") for d in details), details
+        assert not any("USE TEMP B-TREE" in d for d in details), details
+
+def test_get_unique_events_uses_covering_event_index(user_id):
+    for details in query_plans(db.get_unique_events.uncached, user_id):
+        assert any("COVERING INDEX idx_trades_user_event" in d for d in details), details
@@ -0,0 +1,69 @@
+"""User routing across shard files and moving a user between shards."""
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_manager as db
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "tradeflow.db"))
+    monkeypatch.setattr(db, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(db, "SHARDS", 2)
+    db.init_db()
+    yield db.shard_paths()
+    db.close_connections()
+
+def add_trades(user_id, count):
+    db.submit_trades(user_id, [(datetime.date(2024, 1, 1 + i % 28), "BTC", 100, 110 + i)
+                               for i in range(count)]).result()
+
+def trade_count(path, user_id):
+    with db.using(path), db.get_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM trades WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+def test_users_and_their_trades_land_on_their_own_shard(shards):
+    for name in ("alice", "bob"):
+        assert db.create_user(name, "pw")
+    alice, bob = db.get_user_id("alice"), db.get_user_id("bob")
+    assert {db.shard_of(alice), db.shard_of(bob)} == {0, 1}
+    add_trades(alice, 3)
+    add_trades(bob, 5)
+    assert trade_count(shards[db.shard_of(alice)], alice) == 3
+    assert trade_count(shards[db.shard_of(bob)], bob) == 5
+    assert trade_count(shards[1 - db.shard_of(alice)], alice) == 0
+    assert db.authenticate_user("bob", "pw") == (bob, "bob")
+    assert len(db.get_user_trades(bob)) == 5
+
+def test_user_ids_are_unique_across_shards(shards):
+    for i in range(6):
+        db.create_user(f"user{i}", "pw")
+    ids = [db.get_user_id(f"user{i}") for i in range(6)]
+    assert len(set(ids)) == 6
+    assert not db.create_user("user0", "pw")
+
+def test_move_user_copies_trades_and_reroutes(shards):
+    db.create_user("alice", "pw")
+    alice = db.get_user_id("alice")
+    add_trades(alice, 7)
+    before = db.get_trade_totals(alice)
+    source = db.shard_of(alice)
+
+    assert db.move_user(alice, 1 - source) == 7
+    assert db.shard_of(alice) == 1 - source
+    assert trade_count(shards[source], alice) == 0
+    assert trade_count(shards[1 - source], alice) == 7
+    assert db.get_trade_totals(alice) == before
+    assert db.authenticate_user("alice", "pw") == (alice, "alice")
+    assert db.move_user(alice, 1 - source) == 0
+
+def test_move_user_rejects_bad_targets(shards):
+    db.create_user("alice", "pw")
+    with pytest.raises(ValueError):
+        db.move_user(db.get_user_id("alice"), 2)
+    with pytest.raises(ValueError):
+        db.move_user(12345, 0)
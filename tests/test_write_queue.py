@@ -0,0 +1,91 @@
+"""Group commit and per-operation failure isolation in the write-behind queue."""
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from write_queue import WriteQueue
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "queue.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE items (value INTEGER UNIQUE)")
+    return path
+
+@pytest.fixture
+def wq(path):
+    @contextmanager
+    def connect():
+        conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            yield conn
+        finally:
+            conn.close()
+    wq = WriteQueue(connect)
+    yield wq
+    wq.shutdown()
+
+def insert(c, value):
+    c.execute("INSERT INTO items (value) VALUES (?)", (value,))
+    return value
+
+def values(path):
+    with sqlite3.connect(path) as conn:
+        return sorted(row[0] for row in conn.execute("SELECT value FROM items"))
+
+def test_writes_queued_behind_a_commit_share_the_next_one(wq, path):
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(c):
+        started.set()
+        release.wait()
+
+    first = wq.submit(blocker)
+    started.wait()
+    futures = [wq.submit(insert, i) for i in range(20)]
+    release.set()
+    assert [f.result() for f in futures] == list(range(20))
+    first.result()
+    stats = wq.stats()
+    assert stats['batches'] == 2
+    assert stats['largest_batch'] == 20
+    assert stats['committed'] == 21
+    assert values(path) == list(range(20))
+
+def test_failing_write_only_fails_its_own_future(wq, path):
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(c):
+        started.set()
+        release.wait()
+
+    def insert_then_fail(c):
+        insert(c, 100)   # rolled back with its savepoint
+        insert(c, 1)     # UNIQUE violation
+
+    wq.submit(blocker)
+    started.wait()
+    ok = [wq.submit(insert, 1), wq.submit(insert, 2)]
+    bad = wq.submit(insert_then_fail)
+    after = wq.submit(insert, 3)
+    release.set()
+
+    with pytest.raises(sqlite3.IntegrityError):
+        bad.result()
+    assert [f.result() for f in ok] + [after.result()] == [1, 2, 3]
+    assert values(path) == [1, 2, 3]
+    assert wq.stats()['failed'] == 1
+
+def test_shutdown_commits_queued_writes_and_rejects_new_ones(wq, path):
+    futures = [wq.submit(insert, i) for i in range(5)]
+    wq.shutdown()
+    assert all(f.done() for f in futures)
+    assert values(path) == list(range(5))
+    with pytest.raises(RuntimeError):
+        wq.submit(insert, 99)
@@ -0,0 +1,156 @@
+"""Process-wide write-behind queue with group commit.
+
+Sessions submit small write operations and get a Future back. A single writer thread
+drains the queue and applies everything that is waiting - up to `max_batch` operations,
+optionally holding the batch open `max_latency_ms` for more - in one transaction, so
+many concurrent writers share one commit instead of queueing on SQLite's write lock.
+Each operation runs under its own savepoint: a failing operation only fails its own
+Future and the rest of the batch still commits. With profiling on, the SQL each operation
+ran is handed back with its Future, so the submitting call's slow-query entry shows it.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import instrumentation
+
+_STOP = object()
+
+class QueuedWrite(Future):
+    """Future for a queued operation; `statements` holds the SQL it ran when profiling is on."""
+
+    statements = ()
+
+    def result(self, timeout=None):
+        try:
+            return super().result(timeout)
+        finally:
+            # The writer thread ran the SQL; credit it to the instrumented call waiting here
+            instrumentation.add_statements(self.statements)
+
+class WriteQueue:
+    """Group-commits `fn(cursor, *args)` operations on a background writer thread."""
+
+    def __init__(self, connect, max_batch=500, max_latency_ms=0.0):
+        # `connect()` must return a context manager yielding a sqlite3 connection
+        self.connect = connect
+        self.max_batch = max_batch
+        self.max_latency_ms = max_latency_ms
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.submitted = 0
+        self.committed = 0
+        self.failed = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self._thread = threading.Thread(target=self._run, name="tradeflow-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args):
+        """Queues `fn(cursor, *args)`; the Future resolves to its return value once committed."""
+        future = QueuedWrite()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("write queue is shut down")
+            self.submitted += 1
+            self._queue.put((fn, args, future))
+        return future
+
+    def flush(self):
+        """Blocks until every operation submitted so far has been committed or failed."""
+        self._queue.join()
+
+    def shutdown(self):
+        """Stops accepting writes, commits everything already queued and stops the writer."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'submitted': self.submitted,
+                'committed': self.committed,
+                'failed': self.failed,
+                'pending': self._queue.qsize(),
+                'batches': self.batches,
+                'avg_batch': self.committed / self.batches if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+                'max_batch': self.max_batch,
+                'max_latency_ms': self.max_latency_ms,
+            }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_latency_ms / 1000
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    # Shutting down: take whatever is left without waiting any longer
+                    self._queue.task_done()
+                    stopping = True
+                    deadline = 0
+                    continue
+                batch.append(item)
+            try:
+                self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _commit(self, batch):
+        batch = [(fn, args, future) for fn, args, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        try:
+            with self.connect() as conn:
+                c = conn.cursor()
+                c.execute("BEGIN IMMEDIATE")
+                for fn, args, future in batch:
+                    c.execute("SAVEPOINT queued_write")
+                    try:
+                        if instrumentation.ENABLED:
+                            with instrumentation.capture() as future.statements:
+                                result = fn(c, *args)
+                        else:
+                            result = fn(c, *args)
+                        outcomes.append((future, result, None))
+                    except Exception as e:
+                        c.execute("ROLLBACK TO queued_write")
+                        outcomes.append((future, None, e))
+                    c.execute("RELEASE queued_write")
+                conn.commit()
+        except Exception as e:
+            # Nothing in this batch reached the database
+            with self._lock:
+                self.failed += len(batch)
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        errors = sum(1 for _, _, error in outcomes if error is not None)
+        with self._lock:
+            self.batches += 1
+            self.committed += len(outcomes) - errors
+            self.failed += errors
+            self.largest_batch = max(self.largest_batch, len(outcomes))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)